@@ -2,7 +2,9 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
-from .models import User
+from .deletion import soft_delete
+from .models import User, AuthEvent, UserChange, UserSession
+from .search import filter_users
 
 
 class UserCreationForm(forms.ModelForm):
@@ -63,16 +65,16 @@ class UserAdmin(BaseUserAdmin):
     form = UserChangeForm
     add_form = UserCreationForm
 
-    list_display = ("__str__", "email", "username", "phone", "is_email_verified", "is_phone_verified", "is_staff", "is_superuser", "is_active")
-    list_filter = ("is_staff", "is_superuser", "is_active")
+    list_display = ("__str__", "tenant", "email", "username", "phone", "is_email_verified", "is_phone_verified", "is_staff", "is_superuser", "is_active")
+    list_filter = ("tenant", "is_staff", "is_superuser", "is_active", ("deleted_at", admin.EmptyFieldListFilter))
     search_fields = ("email", "username", "phone", "name")
     ordering = ("email",)
 
     fieldsets = (
-        (None, {"fields": ("email", "username", "phone", "name", "password")}),
+        (None, {"fields": ("tenant", "version", "email", "username", "phone", "name", "password")}),
         ("Verification", {"fields": ("is_email_verified", "email_verified_at", "is_phone_verified", "phone_verified_at")}),
         ("Permissions", {"fields": ("is_active", "is_staff", "is_superuser", "groups", "user_permissions")}),
-        ("Important dates", {"fields": ("last_login", "date_joined")}),
+        ("Important dates", {"fields": ("last_login", "date_joined", "deleted_at", "anonymized_at")}),
     )
 
     add_fieldsets = (
@@ -81,6 +83,62 @@ class UserAdmin(BaseUserAdmin):
             "fields": ("email", "username", "phone", "name", "password1", "password2", "is_staff", "is_superuser"),
         }),
     )
-    readonly_fields = ("email_verified_at", "phone_verified_at", "last_login", "date_joined")
+    readonly_fields = ("tenant", "version", "email_verified_at", "phone_verified_at", "last_login", "date_joined", "deleted_at", "anonymized_at")
+
+    def get_search_results(self, request, queryset, search_term):
+        # route through the indexed staff search instead of icontains on every field
+        if not search_term.strip():
+            return queryset, False
+        return filter_users(queryset, search_term), False
+
+    # deleting from the admin is a soft delete; purge_deleted_users does the cascade in batches
+    def get_deleted_objects(self, objs, request):
+        # skip collecting every related row just to render the confirmation page
+        perms_needed = set() if self.has_delete_permission(request) else {self.opts.verbose_name}
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        soft_delete(obj, request=request)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            soft_delete(obj, request=request)
 
 admin.site.register(User, UserAdmin)
+
+
+@admin.register(AuthEvent)
+class AuthEventAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "kind", "tenant", "identifier", "user_id", "ip")
+    list_filter = ("kind", "tenant")
+    ordering = ("-created_at",)
+    readonly_fields = [f.name for f in AuthEvent._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UserSession)
+class UserSessionAdmin(admin.ModelAdmin):
+    list_display = ("user", "user_agent", "ip", "created_at", "last_seen_at", "revoked_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    ordering = ("-last_seen_at",)
+    readonly_fields = ("jti", "created_at", "last_seen_at", "expires_at")
+
+
+@admin.register(UserChange)
+class UserChangeAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "op", "tenant", "user_id", "version", "fields")
+    list_filter = ("op", "tenant")
+    ordering = ("-id",)
+    readonly_fields = [f.name for f in UserChange._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,170 @@
+"""
+Per-process admission control for auth endpoints.
+
+Each route in accounts.urls is wrapped with admit(<cost class>, view).
+A cost class names a gate (a concurrency limit shared by its classes),
+a priority inside that gate and a queueing deadline. When a gate is full,
+requests wait in a priority queue (lower PRIORITY first, then arrival
+order) until a slot frees up or their deadline passes. Requests that
+can't be served in time are rejected with 503 straight away: when the
+queue is full, or when the observed service time says the wait would
+exceed the deadline anyway.
+
+Limits apply per worker process. Password hashing is CPU-bound, so the
+expensive gate defaults to half the CPUs the process may run on, leaving the
+rest for cheap requests; with several worker processes on one machine,
+divide it between them.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+
+
+def usable_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        return os.cpu_count() or 1
+
+
+DEFAULTS = {
+    "ENABLED": True,
+    "GATES": {
+        "cheap": {"LIMIT": 32, "MAX_QUEUE": 0},
+        "expensive": {"LIMIT": max(1, usable_cpus() // 2), "MAX_QUEUE": 64},
+    },
+    "CLASSES": {
+        "cheap": {"GATE": "cheap", "PRIORITY": 0, "DEADLINE": 0.0},
+        "hash": {"GATE": "expensive", "PRIORITY": 0, "DEADLINE": 2.0},  # seconds in queue
+        "mail": {"GATE": "expensive", "PRIORITY": 1, "DEADLINE": 5.0},
+    },
+}
+
+# weight of the latest sample in the service time moving average
+EWMA_ALPHA = 0.2
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ADMISSION_CONTROL", {})}
+
+
+class Gate:
+    def __init__(self, name, limit, max_queue):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.service_time = None  # EWMA seconds
+
+    def _expected_wait(self, position):
+        if self.service_time is None:
+            return 0.0
+        return (position + 1) * self.service_time / self.limit
+
+    def acquire(self, priority, deadline):
+        with self._cond:
+            if self.in_flight < self.limit and not self._queue:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+
+            # only waiters of the same or a more urgent priority will be served first
+            ahead = sum(1 for queued_priority, _ in self._queue if queued_priority <= priority)
+            if len(self._queue) >= self.max_queue or self._expected_wait(ahead) > deadline:
+                self.shed += 1
+                return False
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            expires = time.monotonic() + deadline
+            while True:
+                if self._queue[0] == entry and self.in_flight < self.limit:
+                    heapq.heappop(self._queue)
+                    self.in_flight += 1
+                    self.admitted += 1
+                    # the next waiter may fit too
+                    self._cond.notify_all()
+                    return True
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self.shed += 1
+                    self._cond.notify_all()
+                    return False
+                self._cond.wait(remaining)
+
+    def release(self, elapsed):
+        with self._cond:
+            self.in_flight -= 1
+            if self.service_time is None:
+                self.service_time = elapsed
+            else:
+                self.service_time += EWMA_ALPHA * (elapsed - self.service_time)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "service_time_ms": round(self.service_time * 1000, 2) if self.service_time is not None else None,
+            }
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(name):
+    gate = _gates.get(name)
+    if gate is None:
+        with _gates_lock:
+            gate = _gates.get(name)
+            if gate is None:
+                cfg = get_config()["GATES"][name]
+                gate = _gates[name] = Gate(name, cfg["LIMIT"], cfg.get("MAX_QUEUE", 0))
+    return gate
+
+
+def gauges():
+    """Live per-gate concurrency figures for this worker process."""
+    for name in get_config()["GATES"]:
+        get_gate(name)
+    return {name: gate.stats() for name, gate in _gates.items()}
+
+
+def admit(cost_class, view):
+    """Wrap a view so it only runs once its cost class' gate admits the request."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        cfg = get_config()
+        if not cfg["ENABLED"]:
+            return view(request, *args, **kwargs)
+        cls = cfg["CLASSES"][cost_class]
+        gate = get_gate(cls["GATE"])
+        if not gate.acquire(cls["PRIORITY"], cls["DEADLINE"]):
+            response = JsonResponse({"detail": "Server busy, retry later"}, status=503)
+            response["Retry-After"] = "1"
+            return response
+        start = time.monotonic()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            gate.release(time.monotonic() - start)
+    wrapped.cost_class = cost_class
+    return wrapped
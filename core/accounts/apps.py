@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def sync_name_search(using, **kwargs):
+    from .search import ensure_sqlite_fts
+    ensure_sqlite_fts(connections[using])
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from . import checks  # noqa: F401 registers the system checks
+
+        # module-level so the signal's weak reference outlives ready()
+        post_migrate.connect(sync_name_search, sender=self, dispatch_uid="accounts_sync_name_search")
@@ -1,6 +1,11 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from . import sessions, stuffing
+from .tenancy import get_current_tenant
 
 UserModel = get_user_model()
 
@@ -9,6 +14,7 @@ class MultiFieldModelBackend(ModelBackend):
     """
     Authenticate using email OR username OR phone.
     The "username" parameter passed to authenticate() is treated as the identifier.
+    Lookups are scoped to the current tenant.
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -19,14 +25,37 @@ class MultiFieldModelBackend(ModelBackend):
         if username is None:
             return None
 
-        try:
-            user = UserModel.objects.get(
-                Q(email__iexact=username) | Q(username__iexact=username) | Q(phone__iexact=username)
-            )
-        except UserModel.DoesNotExist:
+        if stuffing.check(request) != stuffing.ALLOW:
+            # returning None would let the next backend (ModelBackend) try the password
+            raise PermissionDenied
+
+        tenant = getattr(request, "tenant", None)
+        user = UserModel.objects.get_by_identifier(username, tenant=tenant)
+        if user is None:
+            stuffing.observe(request, username, success=False)
             return None
 
         # use check_password from AbstractBaseUser
         if user.check_password(password) and self.user_can_authenticate(user):
+            stuffing.observe(request, username, success=True)
             return user
-        return None
\ No newline at end of file
+        stuffing.observe(request, username, success=False)
+        return None
+
+
+class TenantJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that refuses tokens issued to users of another tenant
+    or belonging to a revoked session, and records session activity.
+    """
+
+    def get_user(self, validated_token):
+        sid = validated_token.get("sid")
+        if sid and sessions.is_revoked(sid):
+            raise AuthenticationFailed("Session revoked", code="session_revoked")
+        user = super().get_user(validated_token)
+        if user.tenant != get_current_tenant():
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if sid:
+            sessions.touch(sid)
+        return user
@@ -0,0 +1,152 @@
+"""
+User change feed.
+
+Every change to a field in CHANGE_FEED_FIELDS increments User.version in the
+same statement and appends a UserChange row in the same transaction: User.save()
+does this itself, and code that changes users with UPDATE statements
+(verification, password reset, deletion) sets version=F("version") + 1 and
+calls record_change()/record_changes() inside its transaction.
+
+Consumers read the feed in id order from /api/auth/changes/?since=<id>,
+continue from the "next" cursor of each response and apply an entry only if
+its version is newer than the one they hold, so reading a page twice is
+harmless. Ids are taken at INSERT, not at COMMIT, so with concurrent writers
+(PostgreSQL) id 11 can be visible before id 10 is. The cursor therefore never
+moves past an entry younger than CHANGE_FEED["SETTLE_TIME"]: such entries are
+served, then served again on the next read, once every transaction that could
+still hold a lower id has committed. Transactions that write changes must
+finish within SETTLE_TIME.
+
+Committed entries are also handed to CHANGE_FEED["SINKS"], e.g. JsonlFileSink.
+
+Purging a user (accounts.deletion.purge_batch) blanks the data of all their
+earlier entries and appends a delete or anonymize entry. Consumers and sinks
+that keep snapshots must drop them when they see it.
+"""
+import json
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import events
+from .models import User, UserChange
+
+logger = logging.getLogger(__name__)
+
+# what an entry carries; password changes are announced by name only
+SNAPSHOT_FIELDS = (
+    "email", "username", "phone", "name",
+    "is_email_verified", "is_phone_verified", "is_active", "is_staff", "deleted_at",
+)
+
+DEFAULTS = {
+    "SINKS": [],  # e.g. ["accounts.changes.JsonlFileSink"]
+    "JSONL_PATH": None,
+    "STREAM_MAX_ROWS": 10000,  # per streamed response; the last line carries the cursor to continue from
+    "SETTLE_TIME": 5.0,  # seconds; longer than any transaction that records changes
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CHANGE_FEED", {})}
+
+
+class JsonlFileSink(events.JsonlFileSink):
+    """Append committed changes to CHANGE_FEED["JSONL_PATH"], one JSON object per line."""
+
+    def __init__(self, path=None):
+        super().__init__(path or get_config()["JSONL_PATH"] or os.path.join(settings.BASE_DIR, "user-changes.jsonl"))
+
+
+_sinks = None
+
+
+def get_sinks():
+    global _sinks
+    if _sinks is None:
+        _sinks = [import_string(path)() for path in get_config()["SINKS"]]
+    return _sinks
+
+
+def _publish(changes):
+    for sink in get_sinks():
+        try:
+            sink.write(changes)
+        except Exception:
+            # the database is the source of truth; a sink can be re-filled from the feed
+            logger.exception("user change sink %s failed, %d changes not written", type(sink).__name__, len(changes))
+
+
+def _append(rows, op, fields):
+    entries = []
+    for row in rows:
+        if op == UserChange.DELETE:
+            # the row is about to go, so its last version only ever exists here
+            version, data = row["version"] + 1, {}
+        else:
+            version, data = row["version"], {f: row[f] for f in SNAPSHOT_FIELDS}
+        entries.append(UserChange(
+            tenant=row["tenant"], user_id=row["id"], version=version, op=op, fields=list(fields), data=data,
+        ))
+    changes = UserChange.objects.bulk_create(entries)
+    if get_sinks():
+        transaction.on_commit(lambda: _publish(changes))
+    return changes
+
+
+def record_change(user, fields, op=UserChange.UPDATE):
+    """
+    Append a change of user to the feed. Call it inside the transaction that
+    changed the user, after the write: updates must increment version in the
+    same UPDATE, creates start at 1, deletes are versioned here. The entry
+    carries the row as written.
+    """
+    row = User.objects.filter(pk=user.pk).values("id", "tenant", "version", *SNAPSHOT_FIELDS).get()
+    if op != UserChange.DELETE:
+        user.version = row["version"]
+    return _append([row], op, fields)[0]
+
+
+def record_changes(user_ids, fields, op=UserChange.UPDATE):
+    """Batch form of record_change() for bulk UPDATEs and deletes (see accounts.deletion)."""
+    rows = User.objects.filter(pk__in=user_ids).values("id", "tenant", "version", *SNAPSHOT_FIELDS)
+    return _append(rows, op, fields)
+
+
+def read_changes(tenant, since=0, limit=100):
+    """
+    One page of a tenant's feed after cursor since; returns (changes, next, has_more).
+    next stops short of the first entry younger than SETTLE_TIME, and has_more
+    is only set when the whole page has settled: the rest is for a later read.
+    """
+    horizon = timezone.now() - timedelta(seconds=get_config()["SETTLE_TIME"])
+    rows = list(UserChange.objects.filter(tenant=tenant, id__gt=since).order_by("id")[: limit + 1])
+    page = rows[:limit]
+    cursor = since
+    for change in page:
+        if change.created_at > horizon:
+            break
+        cursor = change.id
+    return page, cursor, len(rows) > limit and cursor == page[-1].id
+
+
+def stream_changes(tenant, since=0, batch_size=500, max_rows=10000):
+    """
+    Yield the feed as JSON lines, batch_size rows per query, up to max_rows.
+    The last line is {"next": cursor, "has_more": bool}.
+    """
+    sent = 0
+    has_more = True
+    while sent < max_rows:
+        page, since, has_more = read_changes(tenant, since, min(batch_size, max_rows - sent))
+        if page:
+            sent += len(page)
+            yield "".join(json.dumps(c.as_json()) + "\n" for c in page)
+        if not has_more:
+            break
+    yield json.dumps({"next": since, "has_more": has_more}) + "\n"
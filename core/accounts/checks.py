@@ -0,0 +1,30 @@
+"""
+System checks for deployment settings the accounts app relies on.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# backends whose entries other worker processes can't see
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def cache_is_shared(alias="default"):
+    return settings.CACHES.get(alias, {}).get("BACKEND") not in PER_PROCESS_CACHES
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning(
+        "The default cache is local to each worker process.",
+        hint=(
+            "Session revocation then costs a database lookup per authenticated request, and reset-link "
+            "claims and credential-stuffing detection only see the traffic of their own worker. "
+            "Point CACHES['default'] at a cache shared by all workers (file-based, Redis, ...)."
+        ),
+        id="accounts.W001",
+    )]
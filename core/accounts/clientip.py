@@ -0,0 +1,52 @@
+import ipaddress
+from functools import lru_cache
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(p, strict=False) for p in proxies)
+
+
+def _is_trusted(addr, networks):
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in networks)
+
+
+def from_trusted_proxy(request):
+    """True when request was forwarded by one of settings.TRUSTED_PROXIES."""
+    networks = _networks(tuple(getattr(settings, "TRUSTED_PROXIES", ())))
+    return bool(networks) and _is_trusted(request.META.get("REMOTE_ADDR"), networks)
+
+
+def client_ip(request):
+    """
+    Address of the client that sent request.
+
+    REMOTE_ADDR is used as is unless it belongs to settings.TRUSTED_PROXIES
+    (addresses or CIDR networks of the load balancers in front of the app).
+    Then settings.CLIENT_IP_HEADER (X-Forwarded-For) is read from the right,
+    skipping trusted hops: entries left of the first untrusted one are
+    whatever the client chose to send.
+    """
+    if request is None:
+        return None
+    remote = request.META.get("REMOTE_ADDR")
+    if not from_trusted_proxy(request):
+        return remote
+    networks = _networks(tuple(settings.TRUSTED_PROXIES))
+
+    header = request.META.get(getattr(settings, "CLIENT_IP_HEADER", "HTTP_X_FORWARDED_FOR"), "")
+    for hop in reversed([h.strip() for h in header.split(",") if h.strip()]):
+        if _is_trusted(hop, networks):
+            continue
+        try:
+            return str(ipaddress.ip_address(hop))
+        except ValueError:
+            # garbage from a hop we can't vouch for; the proxy is the last address we know
+            return remote
+    return remote
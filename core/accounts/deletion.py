@@ -0,0 +1,137 @@
+"""
+Account deletion.
+
+soft_delete() is all a delete in the admin does: the user is deactivated,
+their identifiers are cleared so email/username/phone can be registered again,
+the allauth rows holding those identifiers are dropped and every session is
+revoked. Everything else (token tables, session rows, M2M rows) stays until
+the purge_deleted_users command picks the user up after
+ACCOUNT_DELETION["GRACE_PERIOD"] and removes it in bounded batches, child
+tables first, each batch in its own transaction.
+"""
+from datetime import timedelta
+
+from allauth.account.models import EmailAddress, EmailConfirmation
+from allauth.socialaccount.models import SocialAccount, SocialToken
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import events, sessions
+from .changes import record_change, record_changes
+from .models import AuthEvent, User, UserChange, UserSession
+
+DEFAULTS = {
+    "GRACE_PERIOD": timedelta(days=30),
+    "BATCH_SIZE": 500,
+    "SLEEP": 0.2,  # seconds between batches
+}
+
+PII_RESET = {
+    "name": None,
+    "email": None,
+    "username": None,
+    "phone": None,
+    "phone_reversed": None,
+    "phone_verification_code": None,
+    "phone_verification_expiry": None,
+    "email_verification_code": None,
+    "email_verification_expiry": None,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ACCOUNT_DELETION", {})}
+
+
+def soft_delete(user, request=None):
+    """Deactivate user and free their identifiers; the heavy cleanup is left to purge_batch()."""
+    fields = {k: v for k, v in PII_RESET.items() if k != "name"}
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(
+            is_active=False, deleted_at=timezone.now(), password=make_password(None),
+            version=F("version") + 1, **fields,
+        )
+        record_change(user, ["is_active", "password", "email", "username", "phone"])
+        # allauth keeps its own copy of the email and the social uid, both unique
+        EmailAddress.objects.filter(user_id=user.pk).delete()
+        SocialAccount.objects.filter(user_id=user.pk).delete()
+        # refresh tokens and, through the revoked sids, access tokens already handed out
+        sessions.revoke_sessions(user.pk)
+    events.record_event(events.ACCOUNT_DELETED, request=request, user=user)
+
+
+def pending_users(cutoff=None, tenant=None):
+    """Soft-deleted users past the grace period that still have to be purged."""
+    if cutoff is None:
+        cutoff = timezone.now() - get_config()["GRACE_PERIOD"]
+    qs = User.objects.filter(deleted_at__lte=cutoff, anonymized_at__isnull=True)
+    if tenant:
+        qs = qs.filter(tenant=tenant)
+    return qs
+
+
+def _child_querysets(ids):
+    """
+    Rows referencing the users, ordered so nothing is deleted before its dependents.
+    Dependents are matched through a subquery on their parent's key rather than a
+    join, so each one is a plain DELETE ... WHERE fk IN (SELECT ...).
+    """
+    tokens = OutstandingToken.objects.filter(user_id__in=ids).values("pk")
+    accounts = SocialAccount.objects.filter(user_id__in=ids).values("pk")
+    addresses = EmailAddress.objects.filter(user_id__in=ids).values("pk")
+    return [
+        BlacklistedToken.objects.filter(token_id__in=Subquery(tokens)),
+        OutstandingToken.objects.filter(user_id__in=ids),
+        UserSession.objects.filter(user_id__in=ids),
+        Token.objects.filter(user_id__in=ids),
+        SocialToken.objects.filter(account_id__in=Subquery(accounts)),
+        SocialAccount.objects.filter(user_id__in=ids),
+        EmailConfirmation.objects.filter(email_address_id__in=Subquery(addresses)),
+        EmailAddress.objects.filter(user_id__in=ids),
+        User.groups.through.objects.filter(user_id__in=ids),
+        User.user_permissions.through.objects.filter(user_id__in=ids),
+    ]
+
+
+def purge_batch(ids, anonymize=False):
+    """
+    Remove one batch of soft-deleted users in a single transaction.
+    Child rows go table by table, dependents first, through QuerySet.delete():
+    tables nothing references become a single DELETE, the rest have their
+    (already emptied) dependents checked first. The users are then deleted,
+    or kept with their personal data wiped when anonymize is set. Their auth
+    events stay for the audit trail without identifier, IP and user agent;
+    their change feed entries keep op, fields and version but lose their data,
+    so the final delete/anonymize entry is the only snapshot left.
+    Returns {model label: rows}.
+    """
+    counts = {}
+    with transaction.atomic():
+        for qs in _child_querysets(ids):
+            _, deleted = qs.delete()
+            for label, n in deleted.items():
+                counts[label] = counts.get(label, 0) + n
+        counts[AuthEvent._meta.label] = AuthEvent.objects.filter(user_id__in=ids).update(
+            identifier=None, ip=None, user_agent=None,
+        )
+        # earlier feed entries carry snapshots of the personal data; the tombstone below replaces them
+        UserChange.objects.filter(user_id__in=ids).update(data={})
+        users = User.objects.filter(pk__in=ids)
+        if anonymize:
+            counts[User._meta.label] = users.update(
+                anonymized_at=timezone.now(), password=make_password(None), last_login=None,
+                version=F("version") + 1, **PII_RESET,
+            )
+            record_changes(ids, ["name"])
+        else:
+            record_changes(ids, [], op=UserChange.DELETE)
+            # whatever still references the users (e.g. admin log entries) goes through the collector
+            _, deleted = users.delete()
+            for label, n in deleted.items():
+                counts[label] = counts.get(label, 0) + n
+    return counts
@@ -0,0 +1,215 @@
+"""
+Auth event pipeline.
+
+Views call record_event() which only appends to an in-process ring buffer.
+A background thread drains the buffer into the configured sinks when it
+reaches AUTH_EVENTS["BATCH_SIZE"] or every AUTH_EVENTS["FLUSH_INTERVAL"]
+seconds, and once more when the process exits. When the buffer is full the
+oldest events are dropped, so overload never blocks a request; the flusher
+logs a warning with the number of events dropped since its previous run.
+"""
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass, field, asdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .clientip import client_ip
+from .tenancy import get_current_tenant
+
+logger = logging.getLogger(__name__)
+
+LOGIN_SUCCEEDED = "login_succeeded"
+LOGIN_FAILED = "login_failed"
+LOGIN_BLOCKED = "login_blocked"
+TOKEN_SENT = "token_sent"
+VERIFY_SUCCEEDED = "verify_succeeded"
+VERIFY_FAILED = "verify_failed"
+PASSWORD_RESET = "password_reset"
+PASSWORD_RESET_FAILED = "password_reset_failed"
+ACCOUNT_DELETED = "account_deleted"
+
+EVENT_KINDS = (
+    LOGIN_SUCCEEDED, LOGIN_FAILED, LOGIN_BLOCKED, TOKEN_SENT, VERIFY_SUCCEEDED,
+    VERIFY_FAILED, PASSWORD_RESET, PASSWORD_RESET_FAILED, ACCOUNT_DELETED,
+)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SINKS": ["accounts.events.DatabaseSink"],  # also: JsonlFileSink, StdoutSink
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL": 2.0,  # seconds
+    "MAX_BUFFER": 10000,  # oldest events are dropped beyond this
+    "JSONL_PATH": None,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "AUTH_EVENTS", {})}
+
+
+@dataclass
+class AuthEventRecord:
+    kind: str
+    tenant: str
+    user_id: str = None
+    identifier: str = None
+    ip: str = None
+    user_agent: str = None
+    data: dict = field(default_factory=dict)
+    created_at: object = field(default_factory=timezone.now)
+
+    def as_json(self):
+        d = asdict(self)
+        d["created_at"] = self.created_at.isoformat()
+        return d
+
+
+class DatabaseSink:
+    """Write batches to the AuthEvent table with a single bulk_create."""
+
+    def write(self, records):
+        from .models import AuthEvent
+
+        AuthEvent.objects.bulk_create(
+            [AuthEvent(
+                kind=r.kind, tenant=r.tenant, user_id=r.user_id, identifier=r.identifier,
+                ip=r.ip, user_agent=r.user_agent, data=r.data, created_at=r.created_at,
+            ) for r in records],
+            batch_size=500,
+        )
+
+
+class JsonlFileSink:
+    """Append one JSON object per line to AUTH_EVENTS["JSONL_PATH"]."""
+
+    def __init__(self, path=None):
+        self.path = path or get_config()["JSONL_PATH"] or os.path.join(settings.BASE_DIR, "auth-events.jsonl")
+
+    def write(self, records):
+        lines = "".join(json.dumps(r.as_json(), default=str) + "\n" for r in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class StdoutSink:
+    def write(self, records):
+        sys.stdout.write("".join(json.dumps(r.as_json(), default=str) + "\n" for r in records))
+        sys.stdout.flush()
+
+
+class EventBuffer:
+    def __init__(self, sinks, batch_size, flush_interval, max_buffer):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._events = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.dropped = 0
+        self._dropped_reported = 0
+
+    def add(self, record):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(record)
+            full = len(self._events) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # threads don't survive fork, so (re)start the flusher in each worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="auth-events-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def _drain(self):
+        with self._lock:
+            batch = list(self._events)
+            self._events.clear()
+            dropped, self._dropped_reported = self.dropped - self._dropped_reported, self.dropped
+        return batch, dropped
+
+    def flush(self):
+        with self._flush_lock:
+            batch, dropped = self._drain()
+            if dropped:
+                logger.warning("auth event buffer full, %d events dropped since the last flush (%d in total)", dropped, self.dropped)
+            if not batch:
+                return 0
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception:
+                    logger.exception("auth event sink %s failed, %d events lost", type(sink).__name__, len(batch))
+            return len(batch)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                cfg = get_config()
+                sinks = [import_string(path)() for path in cfg["SINKS"]]
+                _buffer = EventBuffer(sinks, cfg["BATCH_SIZE"], cfg["FLUSH_INTERVAL"], cfg["MAX_BUFFER"])
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def flush_events():
+    """Synchronously write everything buffered so far (used on shutdown and in management commands)."""
+    if _buffer is not None:
+        return _buffer.flush()
+    return 0
+
+
+def record_event(kind, request=None, user=None, identifier=None, **data):
+    """Queue an auth event; never touches the database on the calling thread."""
+    if not get_config()["ENABLED"]:
+        return
+    record = AuthEventRecord(
+        kind=kind,
+        tenant=getattr(request, "tenant", None) or get_current_tenant(),
+        user_id=str(user.pk) if user is not None else None,
+        identifier=identifier,
+        ip=client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")[:255] if request is not None else None,
+        data=data,
+    )
+    get_buffer().add(record)
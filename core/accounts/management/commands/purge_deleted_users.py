@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts import deletion
+
+
+class Command(BaseCommand):
+    help = (
+        "Hard-delete (or anonymize) soft-deleted users past the grace period in bounded batches. "
+        "Every batch commits on its own, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        cfg = deletion.get_config()
+        parser.add_argument("--anonymize", action="store_true", help="Keep the user rows with personal data wiped.")
+        parser.add_argument("--batch-size", type=int, default=cfg["BATCH_SIZE"])
+        parser.add_argument("--sleep", type=float, default=cfg["SLEEP"], help="Seconds to pause between batches.")
+        parser.add_argument(
+            "--grace-days", type=float, default=None,
+            help="Only purge users deleted at least this many days ago (default: ACCOUNT_DELETION['GRACE_PERIOD']).",
+        )
+        parser.add_argument("--tenant", default=None)
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many users.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        cutoff = None
+        if opts["grace_days"] is not None:
+            cutoff = timezone.now() - timedelta(days=opts["grace_days"])
+        qs = deletion.pending_users(cutoff, opts["tenant"]).order_by("deleted_at", "pk")
+
+        if opts["dry_run"]:
+            self.stdout.write(f"{qs.count()} users pending purge")
+            return
+
+        batch_size, limit = opts["batch_size"], opts["limit"]
+        done, batches, started = 0, 0, time.monotonic()
+        totals = {}
+        while limit is None or done < limit:
+            size = batch_size if limit is None else min(batch_size, limit - done)
+            ids = list(qs.values_list("pk", flat=True)[:size])
+            if not ids:
+                break
+            t0 = time.monotonic()
+            counts = deletion.purge_batch(ids, anonymize=opts["anonymize"])
+            elapsed = time.monotonic() - t0
+            done += len(ids)
+            batches += 1
+            for label, n in counts.items():
+                totals[label] = totals.get(label, 0) + n
+            self.stdout.write(
+                f"batch {batches}: {len(ids)} users in {elapsed:.2f}s, {done} done "
+                f"({done / (time.monotonic() - started):.0f}/s)"
+            )
+            if opts["sleep"] and len(ids) == size:
+                time.sleep(opts["sleep"])
+
+        for label, n in sorted(totals.items()):
+            if n:
+                self.stdout.write(f"  {label}: {n}")
+        action = "anonymized" if opts["anonymize"] else "deleted"
+        self.stdout.write(self.style.SUCCESS(f"{done} users {action} in {batches} batches"))
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:32
+
+import accounts.tenancy
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='accounts_us_email_74c8d6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='accounts_us_usernam_c0ea66_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='accounts_us_phone_f54457_idx',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='tenant',
+            field=models.CharField(default=accounts.tenancy.get_current_tenant, editable=False, max_length=63),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(blank=True, max_length=150, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(models.F('tenant'), django.db.models.functions.text.Lower('email'), name='user_tenant_email_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(models.F('tenant'), django.db.models.functions.text.Lower('username'), name='user_tenant_username_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('tenant', 'phone'), name='user_tenant_phone_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_tenant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32)),
+                ('tenant', models.CharField(max_length=63)),
+                ('user_id', models.UUIDField(blank=True, null=True)),
+                ('identifier', models.CharField(blank=True, max_length=255, null=True)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.CharField(blank=True, max_length=255, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'auth event',
+                'verbose_name_plural': 'auth events',
+                'indexes': [models.Index(fields=['tenant', 'created_at'], name='accounts_au_tenant_cad5f4_idx'), models.Index(fields=['user_id', 'created_at'], name='accounts_au_user_id_a68dd8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_authevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_verification_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_verification_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
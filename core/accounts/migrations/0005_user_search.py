@@ -0,0 +1,91 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:45
+
+from django.db import migrations, models
+
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # matches the UPPER("name"::text) LIKE expression Django emits for icontains
+    'CREATE INDEX IF NOT EXISTS accounts_user_name_trgm ON accounts_user USING gin ((UPPER("name"::text)) gin_trgm_ops)',
+]
+POSTGRES_TRGM_DROP = ["DROP INDEX IF EXISTS accounts_user_name_trgm"]
+
+# FTS5 trigram index on name, kept in step with accounts_user by triggers. Frozen copy of
+# accounts.search.SQLITE_FTS as of this migration; later changes belong in a new migration.
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE accounts_user_fts USING fts5(name, content='accounts_user', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER accounts_user_fts_ai AFTER INSERT ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(rowid, name) VALUES (new.rowid, new.name); END",
+    "CREATE TRIGGER accounts_user_fts_ad AFTER DELETE ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(accounts_user_fts, rowid, name) VALUES ('delete', old.rowid, old.name); END",
+    "CREATE TRIGGER accounts_user_fts_au AFTER UPDATE OF name ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(accounts_user_fts, rowid, name) VALUES ('delete', old.rowid, old.name); "
+    "INSERT INTO accounts_user_fts(rowid, name) VALUES (new.rowid, new.name); END",
+    "INSERT INTO accounts_user_fts(accounts_user_fts) VALUES ('rebuild')",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS accounts_user_fts_ai",
+    "DROP TRIGGER IF EXISTS accounts_user_fts_ad",
+    "DROP TRIGGER IF EXISTS accounts_user_fts_au",
+    "DROP TABLE IF EXISTS accounts_user_fts",
+]
+
+
+def run_statements(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_name_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        run_statements(schema_editor, POSTGRES_TRGM)
+    elif vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            has_fts5 = cursor.fetchone()[0]
+        # without FTS5 text search falls back to icontains
+        if has_fts5:
+            run_statements(schema_editor, SQLITE_FTS_DROP + SQLITE_FTS)
+
+
+def drop_name_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        run_statements(schema_editor, POSTGRES_TRGM_DROP)
+    elif vendor == "sqlite":
+        run_statements(schema_editor, SQLITE_FTS_DROP)
+
+
+def fill_phone_reversed(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    batch = []
+    for user in User.objects.exclude(phone__isnull=True).only("id", "phone").iterator(chunk_size=2000):
+        user.phone_reversed = "".join(ch for ch in user.phone if ch.isdigit())[::-1] or None
+        batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ["phone_reversed"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["phone_reversed"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_verification_attempts'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_reversed',
+            field=models.CharField(blank=True, editable=False, max_length=30, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['tenant', 'phone_reversed'], name='user_tenant_phone_rev_idx'),
+        ),
+        migrations.RunPython(fill_phone_reversed, migrations.RunPython.noop),
+        migrations.RunPython(create_name_search, drop_name_search),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:06
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_user_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='version',
+            field=models.PositiveBigIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='UserChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tenant', models.CharField(max_length=63)),
+                ('user_id', models.UUIDField()),
+                ('version', models.PositiveBigIntegerField()),
+                ('op', models.CharField(max_length=6)),
+                ('fields', models.JSONField(blank=True, default=list)),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'user change',
+                'verbose_name_plural': 'user changes',
+                'indexes': [models.Index(fields=['tenant', 'id'], name='accounts_us_tenant_6dde7c_idx')],
+            },
+        ),
+    ]
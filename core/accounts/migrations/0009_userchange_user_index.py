@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_user_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userchange',
+            index=models.Index(fields=['user_id', 'id'], name='accounts_us_user_id_e4ceae_idx'),
+        ),
+    ]
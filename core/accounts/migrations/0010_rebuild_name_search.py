@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:02
+
+from django.db import migrations
+
+# 0008 adds User.version, which SQLite applies by remaking accounts_user: the FTS triggers
+# from 0005 go with the old table and the rowids the index points at are renumbered.
+# Frozen copy of accounts.search.SQLITE_FTS as of this migration.
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE accounts_user_fts USING fts5(name, content='accounts_user', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER accounts_user_fts_ai AFTER INSERT ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(rowid, name) VALUES (new.rowid, new.name); END",
+    "CREATE TRIGGER accounts_user_fts_ad AFTER DELETE ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(accounts_user_fts, rowid, name) VALUES ('delete', old.rowid, old.name); END",
+    "CREATE TRIGGER accounts_user_fts_au AFTER UPDATE OF name ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(accounts_user_fts, rowid, name) VALUES ('delete', old.rowid, old.name); "
+    "INSERT INTO accounts_user_fts(rowid, name) VALUES (new.rowid, new.name); END",
+    "INSERT INTO accounts_user_fts(accounts_user_fts) VALUES ('rebuild')",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS accounts_user_fts_ai",
+    "DROP TRIGGER IF EXISTS accounts_user_fts_ad",
+    "DROP TRIGGER IF EXISTS accounts_user_fts_au",
+    "DROP TABLE IF EXISTS accounts_user_fts",
+]
+
+
+def rebuild_name_search(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        has_fts5 = cursor.fetchone()[0]
+    # without FTS5 text search falls back to icontains
+    if has_fts5:
+        for sql in SQLITE_FTS_DROP + SQLITE_FTS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_userchange_user_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_name_search, migrations.RunPython.noop),
+    ]
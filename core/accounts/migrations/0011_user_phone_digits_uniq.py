@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:03
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# SQLite applies the constraint changes below by remaking accounts_user, which drops the FTS
+# triggers again; 0010's frozen rebuild puts them back
+rebuild_name_search = import_module("accounts.migrations.0010_rebuild_name_search").rebuild_name_search
+
+
+def check_duplicate_phones(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    duplicates = list(
+        User.objects.exclude(phone_reversed__isnull=True)
+        .values("tenant", "phone_reversed")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("tenant", "phone_reversed")[:10]
+    )
+    if duplicates:
+        found = ", ".join(f"{tenant}: {digits[::-1]}" for tenant, digits in duplicates)
+        raise RuntimeError(
+            f"Users share a phone number once formatting is ignored ({found}). "
+            "Merge or clear them before applying this migration."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_rebuild_name_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_phones, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='user',
+            name='user_tenant_phone_uniq',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_tenant_phone_rev_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('tenant', 'phone_reversed'), name='user_tenant_phone_digits_uniq'),
+        ),
+        migrations.RunPython(rebuild_name_search, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,36 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+import re
 import uuid
 
+from .tenancy import get_current_tenant
+
+
+PHONE_RE = re.compile(r"^\+?[\d\s().-]+$")
+
+
+def phone_digits(value):
+    return "".join(ch for ch in value if ch.isdigit()) if value else ""
+
+
+def normalize_phone(value):
+    """Digits of value if it reads as a phone number ("+1 555 0100" -> "15550100"), else None."""
+    if value and PHONE_RE.match(value.strip()):
+        return phone_digits(value) or None
+    return None
+
+
+# fields whose changes are published on the user change feed (see accounts.changes)
+CHANGE_FEED_FIELDS = (
+    "email", "username", "phone", "name", "password",
+    "is_email_verified", "is_phone_verified", "is_active", "is_staff",
+)
+
 class CustomUserManager(BaseUserManager):
     use_in_migrations = True
 
@@ -46,19 +72,50 @@ class CustomUserManager(BaseUserManager):
 
         return self._create_user(email=email, username=username, phone=phone, name=name, password=password, **extra_fields)
 
+    def identifier_query(self, identifier, tenant=None):
+        """
+        Users of a tenant matching identifier as email, username or phone.
+        The expressions mirror the (tenant, normalized identifier) unique indexes
+        on User so each branch of the OR is an index probe.
+        """
+        tenant = tenant or get_current_tenant()
+        folded = identifier.lower()
+        # tenant is repeated in every branch so the planner can probe each index
+        query = Q(tenant=tenant, email_ci=folded) | Q(tenant=tenant, username_ci=folded)
+        digits = normalize_phone(identifier)
+        if digits:
+            # phones are unique on their digits, stored reversed for suffix search
+            query |= Q(tenant=tenant, phone_reversed=digits[::-1])
+        return self.alias(email_ci=Lower("email"), username_ci=Lower("username")).filter(query)
+
+    def get_by_identifier(self, identifier, tenant=None):
+        return self.identifier_query(identifier, tenant).first()
+
+    def get_by_natural_key(self, username):
+        # USERNAME_FIELD is only unique per tenant
+        return self.alias(email_ci=Lower("email")).get(
+            email_ci=username.lower(), tenant=get_current_tenant()
+        )
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, blank=True, null=True)
-    
-    # identifiers are optional but unique
-    email = models.EmailField(max_length=255, unique=True, blank=True, null=True)
-    username = models.CharField(max_length=150, unique=True, blank=True, null=True)
-    phone = models.CharField(max_length=30, unique=True, blank=True, null=True)
+
+    # every identity belongs to exactly one tenant
+    tenant = models.CharField(max_length=63, default=get_current_tenant, editable=False)
+
+    # identifiers are optional but unique within a tenant (see Meta.constraints)
+    email = models.EmailField(max_length=255, blank=True, null=True)
+    username = models.CharField(max_length=150, blank=True, null=True)
+    phone = models.CharField(max_length=30, blank=True, null=True)
+    # digits of phone in reverse, so "ends with" searches become indexed prefix scans
+    phone_reversed = models.CharField(max_length=30, blank=True, null=True, editable=False)
             
     # phone verification
     phone_verification_code = models.CharField(max_length=6, blank=True, null=True)
     phone_verification_expiry = models.DateTimeField(blank=True, null=True)
+    phone_verification_attempts = models.PositiveSmallIntegerField(default=0)
     
     is_phone_verified = models.BooleanField(default=False)
     phone_verified_at = models.DateTimeField(blank=True, null=True)
@@ -66,6 +123,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     # Email verification
     email_verification_code = models.CharField(max_length=32, blank=True, null=True)
     email_verification_expiry = models.DateTimeField(blank=True, null=True)
+    email_verification_attempts = models.PositiveSmallIntegerField(default=0)
     # verification flags + timestamps
     is_email_verified = models.BooleanField(default=False)
     email_verified_at = models.DateTimeField(blank=True, null=True)
@@ -76,6 +134,14 @@ class User(AbstractBaseUser, PermissionsMixin):
     date_joined = models.DateTimeField(default=timezone.now)
     last_login = models.DateTimeField(blank=True, null=True)
 
+    # account deletion (see accounts.deletion): soft-deleted rows wait here until
+    # the purge_deleted_users command hard-deletes or anonymizes them
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+    anonymized_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    # bumped with every entry on the change feed; consumers apply a change only if it is newer
+    version = models.PositiveBigIntegerField(default=1, editable=False)
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
@@ -86,6 +152,57 @@ class User(AbstractBaseUser, PermissionsMixin):
         if not (self.email or self.username or self.phone):
             raise ValidationError("User must have at least one of email, username, or phone.")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what was loaded so save() can tell which feed fields changed
+        instance._feed_values = {
+            name: value for name, value in zip(field_names, values) if name in CHANGE_FEED_FIELDS
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        refreshed = CHANGE_FEED_FIELDS if fields is None else [f for f in fields if f in CHANGE_FEED_FIELDS]
+        deferred = self.get_deferred_fields()
+        self._feed_values = {
+            **getattr(self, "_feed_values", {}),
+            **{f: getattr(self, f) for f in refreshed if f not in deferred},
+        }
+
+    def _changed_feed_fields(self, update_fields):
+        loaded = getattr(self, "_feed_values", None)
+        if self._state.adding or loaded is None:
+            return list(CHANGE_FEED_FIELDS)
+        if update_fields is None:
+            return [f for f in loaded if getattr(self, f) != loaded[f]]
+        return [f for f in update_fields if f in CHANGE_FEED_FIELDS and (f not in loaded or getattr(self, f) != loaded[f])]
+
+    def save(self, *args, **kwargs):
+        self.phone_reversed = phone_digits(self.phone)[::-1] or None
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_reversed"}
+
+        adding = self._state.adding
+        changed = self._changed_feed_fields(update_fields)
+        if not changed:
+            super().save(*args, **kwargs)
+            return
+
+        from .changes import record_change
+
+        if not adding:
+            self.version = F("version") + 1
+            if update_fields is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        # the feed entry commits or rolls back together with the row
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            record_change(self, changed, op=UserChange.CREATE if adding else UserChange.UPDATE)
+        deferred = self.get_deferred_fields()
+        self._feed_values = {f: getattr(self, f) for f in CHANGE_FEED_FIELDS if f not in deferred}
+
     def get_short_name(self):
         return self.name or (self.username or self.email or self.phone)
 
@@ -130,22 +247,126 @@ class User(AbstractBaseUser, PermissionsMixin):
     def generate_email_verification_code(self):
         self.email_verification_code = get_random_string(length=5)
         self.email_verification_expiry = timezone.now() + timedelta(hours=24)
-        self.save(update_fields=["email_verification_code", "email_verification_expiry"])
+        self.email_verification_attempts = 0
+        self.save(update_fields=["email_verification_code", "email_verification_expiry", "email_verification_attempts"])
         return self.email_verification_code
 
     def generate_phone_verification_code(self):
         self.phone_verification_code = get_random_string(length=5, allowed_chars='0123456789')
         self.phone_verification_expiry = timezone.now() + timedelta(minutes=10)
-        self.save(update_fields=["phone_verification_code", "phone_verification_expiry"])
+        self.phone_verification_attempts = 0
+        self.save(update_fields=["phone_verification_code", "phone_verification_expiry", "phone_verification_attempts"])
         return self.phone_verification_code
 
     class Meta:
         verbose_name = "user"
         verbose_name_plural = "users"
-        # You can add indexes for lookups on email/username/phone
+        # identifier lookups always go through these (tenant, normalized identifier) indexes
+        constraints = [
+            models.UniqueConstraint("tenant", Lower("email"), name="user_tenant_email_uniq"),
+            models.UniqueConstraint("tenant", Lower("username"), name="user_tenant_username_uniq"),
+            # on the digits, so "+1 555 0100" and "15550100" are the same phone
+            models.UniqueConstraint(fields=["tenant", "phone_reversed"], name="user_tenant_phone_digits_uniq"),
+        ]
+        # staff search (accounts.search) scans phone suffixes on user_tenant_phone_digits_uniq;
+        # the name trigram/FTS5 indexes are vendor specific and live in migration 0005
+        indexes = [
+            # only rows still waiting for the purge job are indexed
+            models.Index(
+                fields=["deleted_at"], name="user_pending_purge_idx",
+                condition=Q(deleted_at__isnull=False, anonymized_at__isnull=True),
+            ),
+        ]
+    
+
+class AuthEvent(models.Model):
+    """Append-only auth audit log, written in batches by accounts.events."""
+    kind = models.CharField(max_length=32)
+    tenant = models.CharField(max_length=63)
+    # not a FK: events outlive users and batches must not fail on deleted rows
+    user_id = models.UUIDField(blank=True, null=True)
+    identifier = models.CharField(max_length=255, blank=True, null=True)
+    ip = models.GenericIPAddressField(blank=True, null=True)
+    user_agent = models.CharField(max_length=255, blank=True, null=True)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "auth event"
+        verbose_name_plural = "auth events"
+        indexes = [
+            models.Index(fields=["tenant", "created_at"]),
+            models.Index(fields=["user_id", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.identifier or self.user_id or ''}".strip()
+
+
+class UserSession(models.Model):
+    """A device signed in with one refresh token (see accounts.sessions)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sessions")
+    # jti of the refresh token in token_blacklist.OutstandingToken
+    jti = models.CharField(max_length=255, unique=True)
+    user_agent = models.CharField(max_length=255, blank=True, default="")
+    ip = models.GenericIPAddressField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "session"
+        verbose_name_plural = "sessions"
         indexes = [
-            models.Index(fields=["email"]),
-            models.Index(fields=["username"]),
-            models.Index(fields=["phone"]),
+            models.Index(fields=["user", "revoked_at", "-last_seen_at"]),
         ]
-    
\ No newline at end of file
+
+    def __str__(self):
+        return f"{self.user} ({self.user_agent or self.ip or self.pk})"
+
+    @property
+    def is_active(self):
+        return self.revoked_at is None and self.expires_at > timezone.now()
+
+
+class UserChange(models.Model):
+    """Append-only user change feed (see accounts.changes); id is the consumers' cursor."""
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.CharField(max_length=63)
+    # not a FK: delete entries outlive the user
+    user_id = models.UUIDField()
+    version = models.PositiveBigIntegerField()
+    op = models.CharField(max_length=6)
+    fields = models.JSONField(default=list, blank=True)
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "user change"
+        verbose_name_plural = "user changes"
+        indexes = [
+            models.Index(fields=["tenant", "id"]),
+            # a user's entries, for redacting them on purge
+            models.Index(fields=["user_id", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.op} {self.user_id} v{self.version}"
+
+    def as_json(self):
+        return {
+            "id": self.id,
+            "tenant": self.tenant,
+            "user_id": str(self.user_id),
+            "version": self.version,
+            "op": self.op,
+            "fields": self.fields,
+            "data": self.data,
+            "created_at": self.created_at.isoformat(),
+        }
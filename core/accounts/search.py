@@ -0,0 +1,164 @@
+"""
+Staff user search.
+
+A query is classified and routed to an index built for it:
+- email: prefix range on the (tenant, lower(email)) unique index
+- phone: digits matched as a suffix through the (tenant, phone_reversed) unique index
+- text: substring match on name via pg_trgm (PostgreSQL) or an FTS5 trigram
+  table (SQLite), falling back to icontains where neither exists
+
+Results are slim dicts paged with keyset cursors on (sort key, id).
+"""
+import base64
+import json
+
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import PHONE_RE, User, phone_digits
+
+EMAIL = "email"
+PHONE = "phone"
+TEXT = "text"
+
+MIN_PHONE_DIGITS = 3
+FTS_TABLE = "accounts_user_fts"
+# highest BMP code point; closes the range of strings starting with a prefix
+PREFIX_END = "\uffff"
+
+RESULT_FIELDS = ("id", "email", "username", "phone", "name", "is_active", "is_staff")
+
+SQLITE_FTS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, content='accounts_user', content_rowid='rowid', tokenize='trigram')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON accounts_user BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.rowid, new.name); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON accounts_user BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.rowid, old.name); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name ON accounts_user BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.rowid, old.name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.rowid, new.name); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_FTS_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+_has_fts = None
+
+
+def classify(q):
+    q = q.strip()
+    if "@" in q:
+        return EMAIL
+    if PHONE_RE.match(q) and len(phone_digits(q)) >= MIN_PHONE_DIGITS:
+        return PHONE
+    return TEXT
+
+
+def ensure_sqlite_fts(conn):
+    """
+    Create the FTS5 name index on SQLite, or rebuild it when its triggers are gone.
+    SQLite migrations that remake accounts_user drop the triggers and renumber rowids,
+    so this also runs after every migrate (see AccountsConfig.ready).
+    """
+    global _has_fts
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'accounts_user' AND name LIKE %s",
+            [f"{FTS_TABLE}_%"],
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            # without FTS5 text search falls back to icontains
+            return
+        for sql in SQLITE_FTS_DROP + SQLITE_FTS:
+            cursor.execute(sql)
+    _has_fts = None
+
+
+def drop_sqlite_fts(conn):
+    global _has_fts
+    with conn.cursor() as cursor:
+        for sql in SQLITE_FTS_DROP:
+            cursor.execute(sql)
+    _has_fts = None
+
+
+def has_fts_table():
+    global _has_fts
+    if _has_fts is None:
+        _has_fts = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _has_fts
+
+
+def encode_cursor(key, pk):
+    return base64.urlsafe_b64encode(json.dumps([key, str(pk)]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        key, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return key, pk
+
+
+def _route(qs, kind, q):
+    """Filter qs for the query kind; returns (queryset, sort key expression)."""
+    if kind == EMAIL:
+        prefix = q.lower()
+        qs = qs.alias(email_ci=Lower("email")).filter(
+            email_ci__gte=prefix, email_ci__lt=prefix + PREFIX_END, email_ci__startswith=prefix,
+        )
+        return qs, Lower("email")
+
+    if kind == PHONE:
+        rev = phone_digits(q)[::-1]
+        qs = qs.filter(phone_reversed__gte=rev, phone_reversed__lt=rev + PREFIX_END, phone_reversed__startswith=rev)
+        return qs, F("phone_reversed")
+
+    if len(q) >= 3 and has_fts_table():
+        match = '"' + q.replace('"', '""') + '"'
+        # drive the lookup from the FTS hits through rowid
+        qs = qs.alias(fts_rowid=RawSQL('"accounts_user"."rowid"', [])).filter(fts_rowid__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match],
+        ))
+    else:
+        # on PostgreSQL this is served by the upper(name) gin_trgm_ops index
+        qs = qs.filter(name__icontains=q)
+    return qs, F("name")
+
+
+def filter_users(qs, q):
+    """Apply the routed search filter to an existing queryset (used by the admin)."""
+    return _route(qs, classify(q), q.strip())[0]
+
+
+def search_users(q, tenant, cursor=None, limit=20):
+    """Return (kind, results, next_cursor) for a staff search inside a tenant."""
+    q = q.strip()
+    kind = classify(q)
+    qs, sort_key = _route(User.objects.filter(tenant=tenant), kind, q)
+    qs = qs.annotate(sort_key=sort_key)
+
+    if cursor:
+        last_key, last_pk = decode_cursor(cursor)
+        qs = qs.filter(Q(sort_key__gt=last_key) | Q(sort_key=last_key, pk__gt=last_pk))
+
+    rows = list(qs.order_by("sort_key", "pk").values(*RESULT_FIELDS, "sort_key")[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+    for row in rows:
+        del row["sort_key"]
+    return kind, rows, next_cursor
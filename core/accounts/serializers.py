@@ -5,10 +5,29 @@ from rest_framework import serializers
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 
+from .models import UserSession
+
 User = get_user_model()
 token_generator = PasswordResetTokenGenerator()
 
 
+def validate_identifiers_unique(attrs, instance=None):
+    # identifiers are unique per tenant (see User.Meta.constraints) and
+    # interchangeable at login, so none may match another user's email/username/phone
+    errors = {}
+    for field in ('email', 'username', 'phone'):
+        value = attrs.get(field)
+        if not value:
+            continue
+        qs = User.objects.identifier_query(value, tenant=instance.tenant if instance else None)
+        if instance is not None:
+            qs = qs.exclude(pk=instance.pk)
+        if qs.exists():
+            errors[field] = "A user with this identifier already exists."
+    if errors:
+        raise serializers.ValidationError(errors)
+
+
 class RegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     password_confirm = serializers.CharField(write_only=True, required=False)
@@ -25,6 +44,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
             if p1 != p2:
                 raise serializers.ValidationError({"password": "Passwords do not match."})
             validate_password(p1, user=self.instance)
+        validate_identifiers_unique(attrs)
         return attrs
 
     def create(self, validated_data):
@@ -53,6 +73,10 @@ class VerifyTokenSerializer(serializers.Serializer):
     code = serializers.CharField()
     purpose = serializers.ChoiceField(choices=('email', 'phone'))
 
+class PasswordResetRequestSerializer(serializers.Serializer):
+    identifier = serializers.CharField()  # email/username/phone
+
+
 class ResetPasswordSerializer(serializers.Serializer):
     uid = serializers.CharField()
     token = serializers.CharField()
@@ -63,8 +87,37 @@ class ResetPasswordSerializer(serializers.Serializer):
         return v
 
 
+class UserSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=2, max_length=255)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class ChangeFeedSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    # stream=true returns JSON lines fetched limit rows at a time
+    stream = serializers.BooleanField(default=False)
+
+
+class UserSessionSerializer(serializers.ModelSerializer):
+    current = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserSession
+        fields = ('id','user_agent','ip','created_at','last_seen_at','expires_at','current')
+        read_only_fields = fields
+
+    def get_current(self, obj):
+        return str(obj.pk) == self.context.get('current_sid')
+
+
 class UserDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id','email','username','phone','name','is_active','is_staff')
         read_only_fields = ('id','is_staff','is_active')
+
+    def validate(self, attrs):
+        validate_identifiers_unique(attrs, instance=self.instance)
+        return attrs
@@ -0,0 +1,179 @@
+"""
+Per-device sessions.
+
+LoginView opens a UserSession for every refresh token it issues and puts the
+session id in the token as the "sid" claim (access tokens inherit it).
+Authenticated requests only note the sid in memory; a background thread
+writes the latest last_seen_at per session with one bulk_update every
+SESSIONS["LAST_SEEN_FLUSH_INTERVAL"] seconds.
+
+Revoking sessions blacklists their refresh tokens in one statement and marks
+the sids as revoked in the cache for the lifetime of an access token, so
+already-issued access tokens stop working too. That needs a cache shared by
+all workers; with a per-process one (accounts.W001) is_revoked() reads
+UserSession.revoked_at instead.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .checks import cache_is_shared
+from .clientip import client_ip
+from .models import UserSession
+from .tenancy import tenant_cache_key
+from .utils import blacklist_user_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "LAST_SEEN_FLUSH_INTERVAL": 30.0,  # seconds
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "SESSIONS", {})}
+
+
+class LastSeenBuffer:
+    """Keeps only the newest timestamp per session until the next flush."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._pid = None
+
+    def touch(self, sid, when):
+        with self._lock:
+            self._seen[sid] = when
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="session-last-seen", daemon=True).start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                seen, self._seen = self._seen, {}
+            if not seen:
+                return 0
+            try:
+                UserSession.objects.bulk_update(
+                    [UserSession(pk=sid, last_seen_at=when) for sid, when in seen.items()],
+                    ["last_seen_at"],
+                    batch_size=500,
+                )
+            except Exception:
+                # last_seen_at is advisory; losing one batch is preferable to failing requests
+                logger.exception("failed to write last_seen_at for %d sessions", len(seen))
+                return 0
+            return len(seen)
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LastSeenBuffer(get_config()["LAST_SEEN_FLUSH_INTERVAL"])
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def open_session(user, refresh, request):
+    """Record the device a refresh token was issued to and tag the token with its sid."""
+    now = timezone.now()
+    session = UserSession.objects.create(
+        user=user,
+        jti=refresh[jwt_settings.JTI_CLAIM],
+        user_agent=request.META.get("HTTP_USER_AGENT", "")[:255],
+        ip=client_ip(request),
+        created_at=now,
+        last_seen_at=now,
+        expires_at=now + jwt_settings.REFRESH_TOKEN_LIFETIME,
+    )
+    refresh["sid"] = str(session.pk)
+    return session
+
+
+def touch(sid):
+    get_buffer().touch(sid, timezone.now())
+
+
+def _revoked_key(sid):
+    # sids are global UUIDs and revocation often runs outside the user's tenant
+    # (shell, support tools), so the key must not depend on the ambient tenant
+    return tenant_cache_key("sid-revoked", sid, tenant="_global")
+
+
+def is_revoked(sid):
+    if not cache_is_shared():
+        # other workers' revocations never reach this process' cache
+        return UserSession.objects.filter(pk=sid, revoked_at__isnull=False).exists()
+    return cache.get(_revoked_key(sid)) is not None
+
+
+def _mark_revoked(sids):
+    if sids:
+        timeout = int(jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        cache.set_many({_revoked_key(sid): 1 for sid in sids}, timeout=timeout)
+
+
+def revoke_sessions(user_id, session_ids=None, keep_sid=None):
+    """
+    Revoke some (session_ids) or all of a user's sessions, optionally keeping keep_sid.
+    Without session_ids every outstanding refresh token of the user is blacklisted,
+    including tokens issued before sessions were tracked.
+    Returns the number of sessions revoked.
+    """
+    qs = UserSession.objects.filter(user_id=user_id, revoked_at__isnull=True)
+    if session_ids is not None:
+        qs = qs.filter(pk__in=session_ids)
+    if keep_sid:
+        qs = qs.exclude(pk=keep_sid)
+    rows = list(qs.values_list("pk", "jti"))
+
+    if session_ids is not None:
+        blacklist_user_tokens(user_id, jtis=[jti for _, jti in rows])
+    else:
+        keep_jti = UserSession.objects.filter(pk=keep_sid).values_list("jti", flat=True).first() if keep_sid else None
+        blacklist_user_tokens(user_id, exclude_jti=keep_jti)
+
+    qs.update(revoked_at=timezone.now())
+    _mark_revoked([str(pk) for pk, _ in rows])
+    return len(rows)
+
+
+def revoke_by_jti(jti):
+    """Mark the session of a single refresh token revoked (used by LogoutView)."""
+    sids = [str(pk) for pk in UserSession.objects.filter(jti=jti, revoked_at__isnull=True).values_list("pk", flat=True)]
+    UserSession.objects.filter(jti=jti).update(revoked_at=timezone.now())
+    _mark_revoked(sids)
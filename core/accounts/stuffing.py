@@ -0,0 +1,314 @@
+"""
+Credential-stuffing detection for login endpoints.
+
+Every login outcome is fed into fixed-size streaming structures keyed by the
+client IP and its subnet (/24 for IPv4, /64 for IPv6):
+- count-min sketches of attempts and failures per source
+- a HyperLogLog of distinct identifiers that failed per source (LRU-bounded)
+
+Counts are kept for the current and previous window and blended into a
+sliding-window estimate. A source trips when most of its attempts fail and it
+has either many failures or failures on many distinct identifiers. Tripped
+sources are rejected (or challenged) before any password hash runs.
+
+Each worker periodically publishes its sketches to the cache and merges the
+other workers' snapshots (count-min sketches add, HyperLogLogs take the
+register max), so decisions see cluster-wide traffic without a cache round
+trip per login. That takes a cache shared by the workers; with a per-process
+cache every worker decides on its own traffic.
+
+Sources are client addresses as resolved by accounts.clientip, so behind a
+load balancer TRUSTED_PROXIES must be set or every login comes from the
+balancer's address.
+"""
+import hashlib
+import ipaddress
+import math
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .checks import cache_is_shared
+from .clientip import client_ip
+from .tenancy import tenant_cache_key
+
+ALLOW = "allow"
+CHALLENGE = "challenge"
+REJECT = "reject"
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MODE": REJECT,  # or CHALLENGE
+    "CHALLENGE_VERIFIER": None,  # dotted path to callable(request) -> bool
+    "WINDOW": 300,  # seconds
+    "MIN_FAILURES": 20,
+    "MIN_FAILURE_RATIO": 0.8,
+    "MAX_DISTINCT_IDENTIFIERS": 15,
+    "SUBNET_MULTIPLIER": 4,  # subnet thresholds are this many times the IP thresholds
+    "CMS_WIDTH": 4096,
+    "CMS_DEPTH": 4,
+    "HLL_PRECISION": 6,
+    "MAX_TRACKED_SOURCES": 10000,
+    "MERGE_INTERVAL": 10,  # seconds; 0 keeps state per process
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CREDENTIAL_STUFFING", {})}
+
+
+@lru_cache(maxsize=4096)
+def _hash64(value):
+    # stable across processes (unlike hash()) so sketches from different workers merge
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class CountMinSketch:
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.table = array("I", bytes(4 * width * depth))
+
+    def _cells(self, key):
+        h = _hash64(key)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        for cell in self._cells(key):
+            self.table[cell] = min(self.table[cell] + count, 0xFFFFFFFF)
+
+    def estimate(self, key):
+        return min(self.table[cell] for cell in self._cells(key))
+
+    def merge(self, other):
+        for i, v in enumerate(other.table):
+            self.table[i] = min(self.table[i] + v, 0xFFFFFFFF)
+
+    def nbytes(self):
+        return self.table.itemsize * len(self.table)
+
+
+class HyperLogLog:
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, precision):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = 1
+        while rank <= 64 - self.p and not rest & (1 << 63):
+            rank += 1
+            rest <<= 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self):
+        alpha = 0.673 if self.m == 16 else 0.697 if self.m == 32 else 0.709 if self.m == 64 else 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # small range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return estimate
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+
+class Window:
+    """Sketches for one time window."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.attempts = CountMinSketch(cfg["CMS_WIDTH"], cfg["CMS_DEPTH"])
+        self.failures = CountMinSketch(cfg["CMS_WIDTH"], cfg["CMS_DEPTH"])
+        self.distinct = OrderedDict()  # source -> HyperLogLog, least recently used first
+
+    def hll(self, source, create=False):
+        hll = self.distinct.get(source)
+        if hll is not None:
+            self.distinct.move_to_end(source)
+        elif create:
+            hll = self.distinct[source] = HyperLogLog(self.cfg["HLL_PRECISION"])
+            if len(self.distinct) > self.cfg["MAX_TRACKED_SOURCES"]:
+                self.distinct.popitem(last=False)
+        return hll
+
+    def observe(self, source, identifier, success):
+        self.attempts.add(source)
+        if not success:
+            self.failures.add(source)
+            # only failed identifiers count, so busy NATs with many real users don't trip
+            if identifier:
+                self.hll(source, create=True).add(identifier.lower())
+
+    def merge(self, other):
+        self.attempts.merge(other.attempts)
+        self.failures.merge(other.failures)
+        for source, hll in other.distinct.items():
+            self.hll(source, create=True).merge(hll)
+
+    def nbytes(self):
+        return self.attempts.nbytes() + self.failures.nbytes() + len(self.distinct) * (1 << self.cfg["HLL_PRECISION"])
+
+
+def sources(ip):
+    """The keys a request is tracked under: its address and its subnet."""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return [("ip", ip)]
+    prefix = 24 if addr.version == 4 else 64
+    net = ipaddress.ip_network(f"{addr}/{prefix}", strict=False)
+    return [("ip", str(addr)), ("net", str(net))]
+
+
+class Detector:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.window = cfg["WINDOW"]
+        self._lock = threading.Lock()
+        self._epoch = self._current_epoch()
+        self.current = Window(cfg)
+        self.previous = Window(cfg)
+        # other workers' snapshots for the current and previous epoch
+        self.peers_current = Window(cfg)
+        self.peers_previous = Window(cfg)
+        self._last_merge = 0.0
+        self.worker_id = f"{os.uname().nodename}:{os.getpid()}"
+
+    def _current_epoch(self, now=None):
+        return int((now or time.time()) // self.window)
+
+    def _rotate(self, now):
+        epoch = self._current_epoch(now)
+        if epoch == self._epoch:
+            return
+        if epoch == self._epoch + 1:
+            self.previous, self.peers_previous = self.current, self.peers_current
+        else:
+            self.previous, self.peers_previous = Window(self.cfg), Window(self.cfg)
+        self.current, self.peers_current = Window(self.cfg), Window(self.cfg)
+        self._epoch = epoch
+
+    def observe(self, ip, identifier, success, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._rotate(now)
+            for kind, source in sources(ip):
+                self.current.observe(f"{kind}:{source}", identifier, success)
+        self._maybe_merge(now)
+
+    def _estimate(self, key, now):
+        # sliding window: all of the current window plus the overlapping share of the previous one
+        weight = 1.0 - (now % self.window) / self.window
+        cur, prev = (self.current, self.peers_current), (self.previous, self.peers_previous)
+        attempts = sum(w.attempts.estimate(key) for w in cur) + weight * sum(w.attempts.estimate(key) for w in prev)
+        failures = sum(w.failures.estimate(key) for w in cur) + weight * sum(w.failures.estimate(key) for w in prev)
+        distinct = HyperLogLog(self.cfg["HLL_PRECISION"])
+        for w in cur + prev:
+            hll = w.hll(key)
+            if hll is not None:
+                distinct.merge(hll)
+        return attempts, failures, distinct.count()
+
+    def tripped(self, ip, now=None):
+        """Return the tripped source key for ip, or None."""
+        now = now or time.time()
+        cfg = self.cfg
+        with self._lock:
+            self._rotate(now)
+            for kind, source in sources(ip):
+                key = f"{kind}:{source}"
+                scale = cfg["SUBNET_MULTIPLIER"] if kind == "net" else 1
+                attempts, failures, distinct = self._estimate(key, now)
+                if failures < cfg["MIN_FAILURE_RATIO"] * attempts:
+                    # mostly successful logins, e.g. an office NAT with many real users
+                    continue
+                if failures >= cfg["MIN_FAILURES"] * scale or distinct >= cfg["MAX_DISTINCT_IDENTIFIERS"] * scale:
+                    return key
+        return None
+
+    def _maybe_merge(self, now):
+        interval = self.cfg["MERGE_INTERVAL"]
+        # a per-process cache has no peers in it (accounts.W001)
+        if not interval or now - self._last_merge < interval or not cache_is_shared():
+            return
+        self._last_merge = now
+        try:
+            self.merge_with_peers()
+        except Exception:
+            # detection keeps working on local data if the cache is unavailable
+            pass
+
+    def merge_with_peers(self):
+        """Publish this worker's window to the cache and load everyone else's."""
+        with self._lock:
+            epoch = self._epoch
+            snapshot = pickle.dumps(self.current, protocol=pickle.HIGHEST_PROTOCOL)
+        timeout = self.window * 2
+        workers_key = tenant_cache_key("stuffing", epoch, "workers", tenant="_global")
+        workers = set(cache.get(workers_key) or ())
+        workers.add(self.worker_id)
+        cache.set_many({
+            workers_key: workers,
+            tenant_cache_key("stuffing", epoch, self.worker_id, tenant="_global"): snapshot,
+        }, timeout=timeout)
+
+        peers = Window(self.cfg)
+        keys = [tenant_cache_key("stuffing", epoch, w, tenant="_global") for w in workers if w != self.worker_id]
+        for data in cache.get_many(keys).values():
+            peers.merge(pickle.loads(data))
+        with self._lock:
+            if self._epoch == epoch:
+                self.peers_current = peers
+
+    def nbytes(self):
+        return sum(w.nbytes() for w in (self.current, self.previous, self.peers_current, self.peers_previous))
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = Detector(get_config())
+    return _detector
+
+
+def check(request):
+    """ALLOW, CHALLENGE or REJECT for a login attempt; cheap, runs before any hashing."""
+    cfg = get_config()
+    ip = client_ip(request)
+    if not cfg["ENABLED"] or not ip or get_detector().tripped(ip) is None:
+        return ALLOW
+    if cfg["MODE"] == CHALLENGE:
+        verifier = cfg["CHALLENGE_VERIFIER"]
+        if verifier and import_string(verifier)(request):
+            return ALLOW
+        return CHALLENGE
+    return REJECT
+
+
+def observe(request, identifier, success):
+    ip = client_ip(request)
+    if ip and get_config()["ENABLED"]:
+        get_detector().observe(ip, identifier, success)
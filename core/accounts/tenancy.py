@@ -0,0 +1,91 @@
+import re
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .clientip import from_trusted_proxy
+
+TENANT_RE = re.compile(r"^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$")
+
+_current_tenant = ContextVar("current_tenant", default=None)
+
+
+def default_tenant():
+    return getattr(settings, "TENANT_DEFAULT", "default")
+
+
+def get_current_tenant():
+    """Tenant of the request being served (falls back to the default tenant)."""
+    return _current_tenant.get() or default_tenant()
+
+
+def set_current_tenant(tenant):
+    return _current_tenant.set(tenant)
+
+
+def reset_current_tenant(token):
+    _current_tenant.reset(token)
+
+
+def normalize_tenant(value):
+    """Return a valid tenant key or None if the value can't be used."""
+    if not value:
+        return None
+    value = value.strip().lower()
+    if not TENANT_RE.match(value):
+        return None
+    allowed = getattr(settings, "TENANTS", None)
+    if allowed and value not in allowed:
+        return None
+    return value
+
+
+def resolve_tenant(request):
+    """
+    Resolve the tenant for a request:
+    1. explicit header (settings.TENANT_HEADER), only when settings.TENANT_HEADER_ENABLED
+       is set or the request was forwarded by one of settings.TRUSTED_PROXIES;
+       otherwise any client could pick its tenant on any host
+    2. exact host mapping (settings.TENANT_HOSTS)
+    3. first label of the host when it is a subdomain of settings.TENANT_BASE_DOMAIN
+    4. settings.TENANT_DEFAULT
+    """
+    if getattr(settings, "TENANT_HEADER_ENABLED", False) or from_trusted_proxy(request):
+        header = getattr(settings, "TENANT_HEADER", "HTTP_X_TENANT")
+        tenant = normalize_tenant(request.META.get(header))
+        if tenant:
+            return tenant
+
+    host = request.get_host().split(":")[0].lower()
+    tenant = normalize_tenant(getattr(settings, "TENANT_HOSTS", {}).get(host))
+    if tenant:
+        return tenant
+
+    base = getattr(settings, "TENANT_BASE_DOMAIN", None)
+    if base and host.endswith("." + base):
+        tenant = normalize_tenant(host[: -len(base) - 1].split(".")[-1])
+        if tenant:
+            return tenant
+
+    return default_tenant()
+
+
+def tenant_cache_key(*parts, tenant=None):
+    """Build a cache key namespaced by tenant so tenants never share entries."""
+    tenant = tenant or get_current_tenant()
+    return ":".join(["t", tenant, *[str(p) for p in parts]])
+
+
+class TenantMiddleware:
+    """Attach request.tenant and expose it to code that has no request (backends, managers)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant = resolve_tenant(request)
+        token = set_current_tenant(request.tenant)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_current_tenant(token)
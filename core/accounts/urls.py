@@ -1,15 +1,28 @@
 from django.urls import path
+from .admission import admit
 from .views import (
     RegisterView, LoginView, LogoutView, SendTokenView,
-    VerifyTokenView, ResetPasswordView, UserDetailView
+    VerifyTokenView, PasswordResetRequestView, ResetPasswordView, UserDetailView,
+    AdmissionStatsView, UserSearchView, SessionListView, SessionRevokeView,
+    RevokeOtherSessionsView, UserSessionsAdminView, ChangeFeedView,
 )
 
+# cost classes (see accounts.admission): "cheap" never queues, "hash" runs a
+# password hasher, "mail" sends email/SMS
 urlpatterns = [
-    path('auth/register/', RegisterView.as_view(), name='auth-register'),
-    path('auth/login/', LoginView.as_view(), name='auth-login'),
-    path('auth/logout/', LogoutView.as_view(), name='auth-logout'),
-    path('auth/send-token/', SendTokenView.as_view(), name='auth-send-token'),
-    path('auth/verify-token/', VerifyTokenView.as_view(), name='auth-verify-token'),
-    path('auth/reset-password/', ResetPasswordView.as_view(), name='auth-reset-password'),
-    path('auth/user/', UserDetailView.as_view(), name='auth-user-detail'),
-]
\ No newline at end of file
+    path('auth/register/', admit('hash', RegisterView.as_view()), name='auth-register'),
+    path('auth/login/', admit('hash', LoginView.as_view()), name='auth-login'),
+    path('auth/logout/', admit('cheap', LogoutView.as_view()), name='auth-logout'),
+    path('auth/send-token/', admit('mail', SendTokenView.as_view()), name='auth-send-token'),
+    path('auth/verify-token/', admit('cheap', VerifyTokenView.as_view()), name='auth-verify-token'),
+    path('auth/password-reset/', admit('mail', PasswordResetRequestView.as_view()), name='auth-password-reset'),
+    path('auth/reset-password/', admit('hash', ResetPasswordView.as_view()), name='auth-reset-password'),
+    path('auth/user/', admit('cheap', UserDetailView.as_view()), name='auth-user-detail'),
+    path('auth/sessions/', admit('cheap', SessionListView.as_view()), name='auth-sessions'),
+    path('auth/sessions/revoke-others/', admit('cheap', RevokeOtherSessionsView.as_view()), name='auth-sessions-revoke-others'),
+    path('auth/sessions/<uuid:pk>/', admit('cheap', SessionRevokeView.as_view()), name='auth-session-revoke'),
+    path('auth/users/<uuid:user_id>/sessions/', admit('cheap', UserSessionsAdminView.as_view()), name='auth-user-sessions'),
+    path('auth/users/search/', admit('cheap', UserSearchView.as_view()), name='auth-user-search'),
+    path('auth/changes/', admit('cheap', ChangeFeedView.as_view()), name='auth-changes'),
+    path('auth/admission/', admit('cheap', AdmissionStatsView.as_view()), name='auth-admission-stats'),
+]
@@ -1,12 +1,20 @@
+import hashlib
+
 from django.contrib.auth import get_user_model
-from django.utils.http import urlsafe_base64_encode
-from django.utils.encoding import force_bytes
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils.crypto import get_random_string
 from django.utils import timezone
 from datetime import timedelta
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+
+from .tenancy import tenant_cache_key
 
 User = get_user_model()
 token_generator = PasswordResetTokenGenerator()
@@ -19,11 +27,83 @@ def make_uid(user):
 def make_token(user):
     return token_generator.make_token(user)
 
+
+# the only User fields PasswordResetTokenGenerator hashes
+RESET_TOKEN_FIELDS = ("id", "password", "last_login", "email")
+
+
+def password_reset_link(user):
+    return settings.PASSWORD_RESET_URL.format(uid=make_uid(user), token=make_token(user))
+
+
+def send_password_reset(user, request=None):
+    """Send a one-time uid/token reset link by email, or by SMS for phone-only users."""
+    link = password_reset_link(user)
+    text = f"Reset your password: {link}"
+    if user.email:
+        send_mail("Reset your password", text, settings.DEFAULT_FROM_EMAIL, [user.email])
+    elif user.phone:
+        send_sms_stub(user.phone, text)
+    else:
+        return False
+    return True
+
+
+def get_user_for_reset(uidb64, token, tenant):
+    """
+    Return the user a reset uid/token pair was issued to, or None.
+    Loads only the fields the token HMAC covers instead of the full row.
+    """
+    try:
+        pk = force_str(urlsafe_base64_decode(uidb64))
+        user = User.objects.only(*RESET_TOKEN_FIELDS).get(pk=pk, tenant=tenant)
+    except (TypeError, ValueError, OverflowError, ValidationError, User.DoesNotExist):
+        return None
+    if not token_generator.check_token(user, token):
+        return None
+    return user
+
+
+def claim_reset_token(token):
+    """Atomically mark a reset token as used; False if it was already claimed."""
+    key = tenant_cache_key("pwreset", hashlib.sha256(token.encode()).hexdigest())
+    return cache.add(key, 1, timeout=settings.PASSWORD_RESET_TIMEOUT)
+
+
+def blacklist_user_tokens(user_id, exclude_jti=None, jtis=None):
+    """
+    Blacklist a user's outstanding refresh tokens (optionally only jtis, or all but
+    exclude_jti) with a single INSERT ... SELECT, whatever the number of tokens.
+    """
+    outstanding = OutstandingToken._meta.db_table
+    blacklisted = BlacklistedToken._meta.db_table
+    sql = (
+        f"INSERT INTO {blacklisted} (token_id, blacklisted_at) "
+        f"SELECT o.id, %s FROM {outstanding} o WHERE o.user_id = %s "
+        f"AND NOT EXISTS (SELECT 1 FROM {blacklisted} b WHERE b.token_id = o.id)"
+    )
+    params = [
+        connection.ops.adapt_datetimefield_value(timezone.now()),
+        OutstandingToken._meta.get_field("user").get_db_prep_value(user_id, connection),
+    ]
+    if exclude_jti:
+        sql += " AND o.jti <> %s"
+        params.append(exclude_jti)
+    if jtis is not None:
+        if not jtis:
+            return 0
+        sql += f" AND o.jti IN ({', '.join(['%s'] * len(jtis))})"
+        params.extend(jtis)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
 def send_verification_email(user, request=None, purpose='verify'):
     code = get_random_string(length=5, allowed_chars='0123456789')
     user.email_verification_code = code
     user.email_verification_expiry = timezone.now() + timedelta(minutes=10)
-    user.save(update_fields=['email_verification_code','email_verification_expiry'])
+    user.email_verification_attempts = 0
+    user.save(update_fields=['email_verification_code','email_verification_expiry','email_verification_attempts'])
 
     subject = "Verify your email"
     message = f"Your verification code is: {code}"
@@ -39,7 +119,8 @@ def send_verification_via_sms(user, purpose='verify'):
     code = get_random_string(length=5, allowed_chars='0123456789')
     user.phone_verification_code = code
     user.phone_verification_expiry = timezone.now() + timedelta(minutes=10)
-    user.save(update_fields=['phone_verification_code', 'phone_verification_expiry'])
+    user.phone_verification_attempts = 0
+    user.save(update_fields=['phone_verification_code', 'phone_verification_expiry', 'phone_verification_attempts'])
 
     text = f"Your verification code is: {code}"
     send_sms_stub(user.phone, text)
\ No newline at end of file
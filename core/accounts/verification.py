@@ -0,0 +1,91 @@
+"""
+Verification code checks that are safe under concurrent attempts.
+
+Every attempt is decided by one conditional UPDATE on the user row:
+a correct code is consumed only if it is still the stored code, unexpired
+and under the attempt limit; a wrong code increments the attempt counter
+with F() and clears the code once the limit is reached. Parallel attempts
+therefore can't verify twice or exceed VERIFICATION_MAX_ATTEMPTS.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .changes import record_change
+
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+LOCKED = "locked"
+
+CHANNELS = ("email", "phone")
+
+
+def max_attempts():
+    return getattr(settings, "VERIFICATION_MAX_ATTEMPTS", 5)
+
+
+def _fields(channel):
+    if channel not in CHANNELS:
+        raise ValueError(f"unknown verification channel: {channel}")
+    return (
+        f"{channel}_verification_code",
+        f"{channel}_verification_expiry",
+        f"{channel}_verification_attempts",
+        f"is_{channel}_verified",
+        f"{channel}_verified_at",
+    )
+
+
+def check_code(user, channel, code):
+    """
+    Check code against the user's pending code for channel ("email" or "phone").
+    Returns VERIFIED, INVALID, EXPIRED or LOCKED and updates user in place on success.
+    """
+    code_f, expiry_f, attempts_f, flag_f, at_f = _fields(channel)
+    stored = getattr(user, code_f)
+    limit = max_attempts()
+    now = timezone.now()
+
+    if getattr(user, attempts_f) >= limit:
+        return LOCKED
+    if not stored:
+        return INVALID
+
+    qs = type(user)._default_manager.filter(pk=user.pk, **{code_f: stored})
+
+    if not constant_time_compare(stored, code):
+        # count the failure; the last allowed failure also burns the code
+        qs.filter(**{f"{attempts_f}__lt": limit}).update(**{
+            attempts_f: F(attempts_f) + 1,
+            code_f: Case(When(**{f"{attempts_f}__gte": limit - 1}, then=Value(None)), default=F(code_f)),
+        })
+        return INVALID
+
+    expiry = getattr(user, expiry_f)
+    if expiry is None or expiry < now:
+        return EXPIRED
+
+    with transaction.atomic():
+        updated = qs.filter(**{f"{attempts_f}__lt": limit, f"{expiry_f}__gte": now}).update(**{
+            flag_f: True,
+            at_f: now,
+            code_f: None,
+            expiry_f: None,
+            attempts_f: 0,
+            "version": F("version") + 1,
+        })
+        if updated:
+            record_change(user, [flag_f])
+    if not updated:
+        # another attempt consumed or invalidated the code first
+        return INVALID
+
+    setattr(user, flag_f, True)
+    setattr(user, at_f, now)
+    setattr(user, code_f, None)
+    setattr(user, expiry_f, None)
+    setattr(user, attempts_f, 0)
+    return VERIFIED
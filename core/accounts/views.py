@@ -3,27 +3,41 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate, get_user_model
 from .serializers import (
     RegistrationSerializer, LoginSerializer, SendTokenSerializer,
-    VerifyTokenSerializer, ResetPasswordSerializer, UserDetailSerializer
+    VerifyTokenSerializer, ResetPasswordSerializer, UserDetailSerializer,
+    PasswordResetRequestSerializer, UserSearchSerializer, UserSessionSerializer,
+    ChangeFeedSerializer,
 )
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.http import urlsafe_base64_decode
 from django.utils.encoding import force_str
 from django.shortcuts import get_object_or_404
-from .utils import send_verification_email, send_verification_via_sms, make_token, make_uid
+from .utils import (
+    send_verification_email, send_verification_via_sms, make_token, make_uid,
+    send_password_reset, get_user_for_reset, claim_reset_token,
+)
+from . import admission, changes, events, search, sessions, stuffing, verification
+from .models import UserSession
 from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 
 User = get_user_model()
 token_generator = PasswordResetTokenGenerator()
 
 
-def get_user_by_identifier(identifier):
-    # case-insensitive search for email/username/phone
-    qs = User.objects.filter(
-        email__iexact=identifier
-    ) | User.objects.filter(username__iexact=identifier) | User.objects.filter(phone__iexact=identifier)
-    return qs.first()
+def get_user_by_identifier(identifier, tenant=None):
+    # case-insensitive search for email/username/phone within the tenant
+    return User.objects.get_by_identifier(identifier, tenant=tenant)
+
+
+def request_password_reset(request, identifier):
+    # same response whether or not the user exists, so this can't be used to probe accounts
+    user = get_user_by_identifier(identifier, request.tenant)
+    if user is not None and user.is_active and send_password_reset(user, request):
+        events.record_event(events.TOKEN_SENT, request, user=user, identifier=identifier, purpose="reset")
+    return Response({"detail":"If the account exists, a reset link has been sent"}, status=status.HTTP_200_OK)
 
 
 class RegisterView(generics.CreateAPIView):
@@ -31,7 +45,7 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = (permissions.AllowAny,)
 
     def perform_create(self, serializer):
-        user = serializer.save()
+        user = serializer.save(tenant=self.request.tenant)
         # Optionally send verification token
         if user.email:
             send_verification_email(user, purpose='verify')
@@ -49,17 +63,36 @@ class LoginView(generics.GenericAPIView):
         identifier = s.validated_data['identifier']
         password = s.validated_data['password']
 
-        user = get_user_by_identifier(identifier)
+        # sources flagged for credential stuffing are turned away before any hashing
+        verdict = stuffing.check(request)
+        if verdict != stuffing.ALLOW:
+            events.record_event(events.LOGIN_BLOCKED, request, identifier=identifier, reason=verdict)
+            if verdict == stuffing.CHALLENGE:
+                return Response({"detail":"Challenge required", "challenge": True}, status=status.HTTP_401_UNAUTHORIZED)
+            response = Response({"detail":"Too many failed logins, try again later"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response["Retry-After"] = str(stuffing.get_config()["WINDOW"])
+            return response
+
+        user = get_user_by_identifier(identifier, request.tenant)
         if user is None:
+            stuffing.observe(request, identifier, success=False)
+            events.record_event(events.LOGIN_FAILED, request, identifier=identifier, reason="unknown_user")
             return Response({"detail":"Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
         if not user.check_password(password):
+            stuffing.observe(request, identifier, success=False)
+            events.record_event(events.LOGIN_FAILED, request, user=user, identifier=identifier, reason="bad_password")
             return Response({"detail":"Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
+        stuffing.observe(request, identifier, success=True)
+
         if not user.is_active:
+            events.record_event(events.LOGIN_FAILED, request, user=user, identifier=identifier, reason="inactive")
             return Response({"detail":"User inactive"}, status=status.HTTP_403_FORBIDDEN)
 
         refresh = RefreshToken.for_user(user)
+        sessions.open_session(user, refresh, request)
+        events.record_event(events.LOGIN_SUCCEEDED, request, user=user, identifier=identifier)
         return Response({
             "access": str(refresh.access_token),
             "refresh": str(refresh),
@@ -78,6 +111,7 @@ class LogoutView(generics.GenericAPIView):
         try:
             token = RefreshToken(refresh_token)
             token.blacklist()
+            sessions.revoke_by_jti(token["jti"])
             return Response({"detail":"Logout successful"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"detail":"Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
@@ -93,17 +127,24 @@ class SendTokenView(generics.GenericAPIView):
         identifier = s.validated_data['identifier']
         purpose = s.validated_data['purpose']
 
-        user = get_user_by_identifier(identifier)
+        if purpose == 'reset':
+            return request_password_reset(request, identifier)
+
+        user = get_user_by_identifier(identifier, request.tenant)
         if not user:
             return Response({"detail":"No user found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if user.email and purpose in ('verify','reset'):
+        if user.email:
             send_verification_email(user, purpose=purpose)
+            channel = "email"
         elif user.phone:
             send_verification_via_sms(user, purpose=purpose)
+            channel = "sms"
         else:
             return Response({"detail":"No delivery method available"}, status=status.HTTP_400_BAD_REQUEST)
 
+        events.record_event(events.TOKEN_SENT, request, user=user, identifier=identifier, purpose=purpose, channel=channel)
+
         return Response({"detail":"Token sent"}, status=status.HTTP_200_OK)
 
 
@@ -111,7 +152,6 @@ class VerifyTokenView(generics.GenericAPIView):
     serializer_class = VerifyTokenSerializer
     permission_classes = (permissions.AllowAny,)
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         s = self.get_serializer(data=request.data)
         s.is_valid(raise_exception=True)
@@ -119,37 +159,32 @@ class VerifyTokenView(generics.GenericAPIView):
         code = s.validated_data['code']
         purpose = s.validated_data['purpose']
 
-        user = get_user_by_identifier(identifier)
+        user = get_user_by_identifier(identifier, request.tenant)
         if not user:
             return Response({"detail": "User not found"}, status=404)
 
-        now = timezone.now()
-
-        if purpose == "phone":
-            if user.phone_verification_code != code:
-                return Response({"detail": "Invalid code"}, status=400)
-            if user.phone_verification_expiry < now:
-                return Response({"detail": "Code expired"}, status=400)
-            user.is_phone_verified = True
-            user.phone_verified_at = now
-            user.phone_verification_code = None
-            user.phone_verification_expiry = None
-            user.save(update_fields=['is_phone_verified', 'phone_verified_at', 'phone_verification_code', 'phone_verification_expiry'])
-
-        elif purpose == "email":
-            if user.email_verification_code != code:
-                return Response({"detail": "Invalid code"}, status=400)
-            if user.email_verification_expiry < now:
+        result = verification.check_code(user, purpose, code)
+        if result != verification.VERIFIED:
+            events.record_event(events.VERIFY_FAILED, request, user=user, identifier=identifier, purpose=purpose, reason=result)
+            if result == verification.LOCKED:
+                return Response({"detail": "Too many attempts, request a new code"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            if result == verification.EXPIRED:
                 return Response({"detail": "Code expired"}, status=400)
-            user.is_email_verified = True
-            user.email_verified_at = now
-            user.email_verification_code = None
-            user.email_verification_expiry = None
-            user.save(update_fields=['is_email_verified', 'email_verified_at', 'email_verification_code', 'email_verification_expiry'])
+            return Response({"detail": "Invalid code"}, status=400)
 
-        user.refresh_from_db()
+        events.record_event(events.VERIFY_SUCCEEDED, request, user=user, identifier=identifier, purpose=purpose)
         return Response({"detail": f"{purpose.capitalize()} verified", "user": UserDetailSerializer(user).data})
 
+class PasswordResetRequestView(generics.GenericAPIView):
+    serializer_class = PasswordResetRequestSerializer
+    permission_classes = (permissions.AllowAny,)
+
+    def post(self, request, *args, **kwargs):
+        s = self.get_serializer(data=request.data)
+        s.is_valid(raise_exception=True)
+        return request_password_reset(request, s.validated_data['identifier'])
+
+
 class ResetPasswordView(generics.GenericAPIView):
     serializer_class = ResetPasswordSerializer
     permission_classes = (permissions.AllowAny,)
@@ -161,17 +196,30 @@ class ResetPasswordView(generics.GenericAPIView):
         token = s.validated_data['token']
         new_password = s.validated_data['new_password']
 
-        try:
-            pk = force_str(urlsafe_base64_decode(uid))
-            user = User.objects.get(pk=pk)
-        except Exception:
-            return Response({"detail":"Invalid uid"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if not token_generator.check_token(user, token):
+        user = get_user_for_reset(uid, token, request.tenant)
+        if user is None:
+            events.record_event(events.PASSWORD_RESET_FAILED, request, reason="invalid_token")
             return Response({"detail":"Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
 
+        if not claim_reset_token(token):
+            events.record_event(events.PASSWORD_RESET_FAILED, request, user=user, reason="token_used")
+            return Response({"detail":"Token already used"}, status=status.HTTP_400_BAD_REQUEST)
+
+        old_hash = user.password
         user.set_password(new_password)
-        user.save()
+        # conditional on the old hash so a concurrent reset with the same token can't win twice
+        with transaction.atomic():
+            updated = User.objects.filter(pk=user.pk, password=old_hash).update(
+                password=user.password, version=F("version") + 1,
+            )
+            if updated:
+                changes.record_change(user, ["password"])
+        if not updated:
+            events.record_event(events.PASSWORD_RESET_FAILED, request, user=user, reason="token_used")
+            return Response({"detail":"Token already used"}, status=status.HTTP_400_BAD_REQUEST)
+
+        revoked = sessions.revoke_sessions(user.pk)
+        events.record_event(events.PASSWORD_RESET, request, user=user, revoked_sessions=revoked)
         return Response({"detail":"Password reset successful"}, status=status.HTTP_200_OK)
 
 
@@ -181,3 +229,100 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         return self.request.user
+
+
+class AdmissionStatsView(generics.GenericAPIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(admission.gauges())
+
+
+class UserSearchView(generics.GenericAPIView):
+    """Staff lookup by email prefix, phone digits/suffix or name; keyset paginated."""
+    serializer_class = UserSearchSerializer
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        s = self.get_serializer(data=request.query_params)
+        s.is_valid(raise_exception=True)
+        try:
+            kind, results, next_cursor = search.search_users(
+                s.validated_data['q'], request.tenant,
+                cursor=s.validated_data.get('cursor'), limit=s.validated_data['limit'],
+            )
+        except ValueError:
+            return Response({"detail":"Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"kind": kind, "results": results, "next": next_cursor})
+
+
+class ChangeFeedView(generics.GenericAPIView):
+    """User changes of the tenant after cursor ?since=, for services that keep their own copy of users."""
+    serializer_class = ChangeFeedSerializer
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        s = self.get_serializer(data=request.query_params)
+        s.is_valid(raise_exception=True)
+        since, limit = s.validated_data['since'], s.validated_data['limit']
+        if s.validated_data['stream']:
+            max_rows = changes.get_config()["STREAM_MAX_ROWS"]
+            return StreamingHttpResponse(
+                changes.stream_changes(request.tenant, since, batch_size=limit, max_rows=max_rows),
+                content_type="application/x-ndjson",
+            )
+        page, cursor, has_more = changes.read_changes(request.tenant, since, limit)
+        return Response({
+            "results": [c.as_json() for c in page],
+            "next": cursor,
+            "has_more": has_more,
+        })
+
+
+class SessionListView(generics.ListAPIView):
+    """Active sessions of the authenticated user, most recently used first."""
+    serializer_class = UserSessionSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = None
+
+    def get_user_id(self):
+        return self.request.user.pk
+
+    def get_queryset(self):
+        return UserSession.objects.filter(
+            user_id=self.get_user_id(), revoked_at__isnull=True, expires_at__gt=timezone.now(),
+        ).order_by('-last_seen_at')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['current_sid'] = self.request.auth.get('sid') if self.request.auth else None
+        return context
+
+
+class SessionRevokeView(generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def delete(self, request, pk, *args, **kwargs):
+        if not sessions.revoke_sessions(request.user.pk, session_ids=[pk]):
+            return Response({"detail":"Session not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RevokeOtherSessionsView(generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        revoked = sessions.revoke_sessions(request.user.pk, keep_sid=request.auth.get('sid'))
+        return Response({"detail":"Other sessions revoked", "revoked": revoked}, status=status.HTTP_200_OK)
+
+
+class UserSessionsAdminView(SessionListView):
+    """Support tooling: list (GET) or revoke all (DELETE) sessions of any user in the tenant."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get_user_id(self):
+        return get_object_or_404(User.objects.only('id'), pk=self.kwargs['user_id'], tenant=self.request.tenant).pk
+
+    def delete(self, request, *args, **kwargs):
+        revoked = sessions.revoke_sessions(self.get_user_id())
+        return Response({"detail":"Sessions revoked", "revoked": revoked}, status=status.HTTP_200_OK)
@@ -0,0 +1,36 @@
+"""
+Benchmarks for the accounts app. Run them from the project directory, e.g.
+
+    python -m bench.admission --seconds 10 --storm 16
+    python -m bench.stuffing --mem
+    python -m bench.purge --users 100000
+    python -m bench.sqlite --profile tuned --procs 8 --threads 8
+    python -m bench.sessions --tokens 5000
+    python -m bench.reset --users 10000
+    python -m bench.events --logins 500
+
+Every script works on its own scratch SQLite database and file cache in the
+temp directory (see bench.settings), recreated on each run; db.sqlite3 and
+the project cache are never touched.
+"""
+import os
+import shutil
+import tempfile
+
+
+def setup(name, migrate=True):
+    """Configure Django on a fresh scratch database for benchmark name."""
+    path = os.path.join(tempfile.gettempdir(), f"auth-bench-{name}.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.environ["BENCH_DB"] = path
+    os.environ["BENCH_CACHE"] = os.path.join(tempfile.gettempdir(), f"auth-bench-{name}-cache")
+    shutil.rmtree(os.environ["BENCH_CACHE"], ignore_errors=True)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench.settings")
+
+    import django
+    django.setup()
+    if migrate:
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0)
@@ -0,0 +1,145 @@
+"""
+Login storm against a live server, with and without admission control.
+
+Starts the project in a threaded WSGI server in a child process. --probes
+threads fetch /api/auth/user/ every 20ms, first on an idle server for
+--idle seconds (the baseline), then for --seconds next to --storm threads
+posting logins (a full password hash each). Reports the probes' latency in
+both phases and the status codes the logins got. With admission control on,
+the storm should be shed with 503s while the probes' p99 stays near the
+idle baseline:
+
+    python -m bench.admission --seconds 10 --storm 8
+    python -m bench.admission --seconds 10 --storm 8 --no-admission
+    python -m bench.admission --seconds 10 --storm 8 --limit 4   # expensive gate LIMIT
+"""
+import argparse
+import json
+import multiprocessing as mp
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from . import setup
+
+EMAIL = "storm@example.com"
+PASSWORD = "Storm-pass-123"
+
+
+def serve(port, admission):
+    from django.conf import settings
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    settings.ADMISSION_CONTROL = admission
+    server = ThreadedWSGIServer(("127.0.0.1", port), QuietHandler)
+    server.set_app(get_wsgi_application())
+    server.serve_forever()
+
+
+def request(url, body=None, headers=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except OSError:
+        return "error", None
+
+
+def percentile(sorted_values, p):
+    return sorted_values[max(int(len(sorted_values) * p) - 1, 0)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--idle", type=float, default=5, help="seconds of probes alone, for the baseline")
+    parser.add_argument("--storm", type=int, default=8, help="threads posting logins")
+    parser.add_argument("--probes", type=int, default=4, help="threads fetching the current user")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-admission", action="store_true")
+    parser.add_argument("--limit", type=int, default=None, help="expensive gate LIMIT (default: derived from CPUs)")
+    args = parser.parse_args()
+
+    setup("admission")
+    from accounts import admission
+    from accounts.models import User
+
+    config = {"ENABLED": not args.no_admission}
+    if args.limit is not None:
+        gates = admission.DEFAULTS["GATES"]
+        config["GATES"] = {**gates, "expensive": {**gates["expensive"], "LIMIT": args.limit}}
+
+    User.objects.create_user(email=EMAIL, password=PASSWORD, is_staff=True)
+    from django.db import connection
+    connection.close()
+
+    server = mp.Process(target=serve, args=(args.port, config), daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{args.port}/api/auth/"
+    credentials = {"identifier": EMAIL, "password": PASSWORD}
+    for _ in range(50):
+        status, body = request(base + "login/", credentials)
+        if status == 200:
+            break
+        time.sleep(0.1)
+    else:
+        raise SystemExit(f"server did not come up on port {args.port}")
+    auth = {"Authorization": "Bearer " + body["access"]}
+
+    lock = threading.Lock()
+    codes = {}
+
+    def storm(stop):
+        while time.monotonic() < stop:
+            status, _ = request(base + "login/", credentials)
+            with lock:
+                codes[status] = codes.get(status, 0) + 1
+
+    def probe(stop, latencies):
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            request(base + "user/", headers=auth)
+            latencies.append(time.perf_counter() - t0)
+            time.sleep(0.02)
+
+    def run(seconds, storm_threads):
+        stop = time.monotonic() + seconds
+        latencies = []
+        threads = [threading.Thread(target=storm, args=(stop,)) for _ in range(storm_threads)]
+        threads += [threading.Thread(target=probe, args=(stop, latencies)) for _ in range(args.probes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return sorted(latencies)
+
+    idle = run(args.idle, 0)
+    loaded = run(args.seconds, args.storm)
+
+    _, gauges = request(base + "admission/", headers=auth)
+    server.terminate()
+
+    limit = gauges["expensive"]["limit"] if gauges else "-"
+    print(f"admission {'off' if args.no_admission else 'on'} (expensive limit {limit}), "
+          f"{args.storm} login threads for {args.seconds:g}s")
+    for phase, latencies in (("idle", idle), ("storm", loaded)):
+        print(f"  /user/ probes, {phase}: n={len(latencies)} "
+              f"p50={percentile(latencies, .5):.0f}ms p99={percentile(latencies, .99):.0f}ms")
+    print(f"  storm p99 / idle p99: {percentile(loaded, .99) / percentile(idle, .99):.1f}x")
+    print(f"  login status codes: {dict(sorted(codes.items(), key=str))}")
+    if gauges:
+        for name, stats in gauges.items():
+            print(f"  gate {name}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
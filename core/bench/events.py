@@ -0,0 +1,91 @@
+"""
+What the auth event log adds to a login.
+
+Posts --logins logins per mode through the Django test client and reports
+each mode's latency:
+- off: AUTH_EVENTS disabled
+- buffered: the shipped pipeline, record_event() appends to the ring buffer
+  and the flusher thread writes batches with DatabaseSink
+- inline: every event written with its own INSERT on the request thread,
+  for comparison
+
+Passwords use the MD5 hasher so the hash doesn't drown out the difference;
+modes run interleaved in --rounds rounds. Also times record_event() alone.
+
+    python -m bench.events --logins 500
+"""
+import argparse
+import statistics
+import time
+
+from . import setup
+
+EMAIL = "events@example.com"
+PASSWORD = "Events-pass-123"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=500, help="logins per mode and round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    setup("events")
+    from django.conf import settings
+    from django.test import Client, RequestFactory
+
+    from accounts import events, sessions
+    from accounts.models import AuthEvent, User
+
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+    settings.ADMISSION_CONTROL = {"ENABLED": False}
+    User.objects.create_user(email=EMAIL, password=PASSWORD)
+
+    class InlineBuffer:
+        sink = events.DatabaseSink()
+
+        def add(self, record):
+            self.sink.write([record])
+
+    buffered = events.get_buffer()
+    modes = {
+        "off": ({"ENABLED": False}, buffered),
+        "buffered": ({"ENABLED": True}, buffered),
+        "inline": ({"ENABLED": True}, InlineBuffer()),
+    }
+    client = Client()
+    credentials = {"identifier": EMAIL, "password": PASSWORD}
+    latencies = {mode: [] for mode in modes}
+    for _ in range(args.rounds):
+        for mode, (config, buffer) in modes.items():
+            settings.AUTH_EVENTS = config
+            events._buffer = buffer
+            for _ in range(args.logins):
+                t0 = time.perf_counter()
+                response = client.post("/api/auth/login/", credentials)
+                latencies[mode].append(time.perf_counter() - t0)
+                assert response.status_code == 200, response.status_code
+            events._buffer = buffered
+            buffered.flush()
+            sessions.get_buffer().flush()
+
+    print(f"{args.logins * args.rounds} logins per mode, {AuthEvent.objects.count()} events written")
+    for mode, values in latencies.items():
+        values.sort()
+        print(f"  {mode:>8}: median {statistics.median(values) * 1000:.2f}ms "
+              f"p99 {values[int(len(values) * .99) - 1] * 1000:.2f}ms")
+
+    settings.AUTH_EVENTS = {"ENABLED": True}
+    request = RequestFactory().post("/api/auth/login/", REMOTE_ADDR="203.0.113.1")
+    request.tenant = "default"
+    n = 20000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        events.record_event(events.LOGIN_FAILED, request, identifier=EMAIL)
+    print(f"  record_event(): {(time.perf_counter() - t0) / n * 1e6:.1f}us per call, "
+          f"{buffered.dropped} dropped from a {buffered._events.maxlen}-event buffer")
+    buffered.stop()
+
+
+if __name__ == "__main__":
+    main()
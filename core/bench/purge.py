@@ -0,0 +1,116 @@
+"""
+Purge soft-deleted users: batched pipeline vs one ORM cascade delete.
+
+Generates --users soft-deleted users past the grace period, each with three
+outstanding refresh tokens (one blacklisted), two sessions, an allauth
+email address, a DRF token, a group membership, three auth events and two
+change feed entries. Then either runs deletion.purge_batch() in batches the
+way purge_deleted_users does, or (--baseline) deletes them all with one
+QuerySet.delete(). Prints the wall time, the longest single transaction and
+the peak RSS:
+
+    python -m bench.purge --users 100000
+    python -m bench.purge --users 100000 --baseline
+"""
+import argparse
+import resource
+import secrets
+import time
+import uuid
+from datetime import timedelta
+
+from . import setup
+
+CHUNK = 5000
+
+
+def generate(n):
+    from allauth.account.models import EmailAddress
+    from django.contrib.auth.models import Group
+    from django.db import transaction
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    from accounts.models import AuthEvent, User, UserChange, UserSession
+
+    now = timezone.now()
+    deleted_at = now - timedelta(days=60)
+    group = Group.objects.create(name="members")
+    for start in range(0, n, CHUNK):
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(email=f"u{i}@example.com", phone=f"+1{i:010d}", name=f"User {i}", password="!",
+                     is_active=False, deleted_at=deleted_at)
+                for i in range(start, min(start + CHUNK, n))
+            ], batch_size=1000)
+            tokens = OutstandingToken.objects.bulk_create([
+                OutstandingToken(user=u, jti=uuid.uuid4().hex, token="-", created_at=now, expires_at=now)
+                for u in users for _ in range(3)
+            ], batch_size=1000)
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=t) for t in tokens[::3]], batch_size=1000)
+            UserSession.objects.bulk_create([
+                UserSession(user=u, jti=uuid.uuid4().hex, expires_at=now) for u in users for _ in range(2)
+            ], batch_size=1000)
+            EmailAddress.objects.bulk_create([EmailAddress(user=u, email=u.email) for u in users], batch_size=1000)
+            Token.objects.bulk_create([Token(user=u, key=secrets.token_hex(20)) for u in users], batch_size=1000)
+            User.groups.through.objects.bulk_create(
+                [User.groups.through(user_id=u.pk, group_id=group.pk) for u in users], batch_size=1000,
+            )
+            AuthEvent.objects.bulk_create([
+                AuthEvent(kind="login_succeeded", tenant=u.tenant, user_id=u.pk, identifier=u.email, ip="203.0.113.1")
+                for u in users for _ in range(3)
+            ], batch_size=1000)
+            UserChange.objects.bulk_create([
+                UserChange(tenant=u.tenant, user_id=u.pk, version=v, op=op, data={"email": u.email})
+                for u in users for v, op in ((1, UserChange.CREATE), (2, UserChange.UPDATE))
+            ], batch_size=1000)
+
+
+def pipeline(batch_size):
+    from accounts import deletion
+
+    qs = deletion.pending_users().order_by("deleted_at", "pk")
+    longest, batches = 0.0, 0
+    while True:
+        ids = list(qs.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return longest, batches
+        t0 = time.monotonic()
+        deletion.purge_batch(ids)
+        longest = max(longest, time.monotonic() - t0)
+        batches += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=None, help="default: ACCOUNT_DELETION['BATCH_SIZE']")
+    parser.add_argument("--baseline", action="store_true", help="one QuerySet.delete() instead of the pipeline")
+    args = parser.parse_args()
+
+    setup("purge")
+    from accounts import deletion
+    from accounts.models import User
+
+    t0 = time.monotonic()
+    generate(args.users)
+    print(f"generated {args.users} soft-deleted users in {time.monotonic() - t0:.1f}s")
+
+    t0 = time.monotonic()
+    if args.baseline:
+        User.objects.filter(deleted_at__isnull=False).delete()
+        elapsed = time.monotonic() - t0
+        summary = f"one transaction of {elapsed:.1f}s"
+    else:
+        longest, batches = pipeline(args.batch_size or deletion.get_config()["BATCH_SIZE"])
+        elapsed = time.monotonic() - t0
+        summary = f"{batches} batches, longest transaction {longest:.2f}s"
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+    print(f"{'cascade delete' if args.baseline else 'pipeline'}: {args.users} users in {elapsed:.1f}s "
+          f"({args.users / elapsed:.0f}/s), {summary}, peak RSS {rss} MiB")
+    assert not User.objects.exists()
+
+
+if __name__ == "__main__":
+    main()
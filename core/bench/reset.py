@@ -0,0 +1,69 @@
+"""
+Cost of validating a password reset uid/token pair.
+
+Creates --users users and times, per call over --iterations random users:
+- full: User.objects.get(pk=...) plus check_token, the way the reset view used to
+- slim: utils.get_user_for_reset(), which loads only the columns the HMAC covers
+- bad token: get_user_for_reset() with a token that fails the HMAC
+- hmac: check_token() alone on a user already in memory
+
+The checks run interleaved for --rounds rounds; the best round is reported.
+
+    python -m bench.reset --users 10000 --iterations 5000
+"""
+import argparse
+import random
+import time
+
+from . import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    setup("reset")
+    from django.utils.encoding import force_str
+    from django.utils.http import urlsafe_base64_decode
+
+    from accounts.models import User
+    from accounts.utils import get_user_for_reset, make_token, make_uid, token_generator
+
+    User.objects.bulk_create([
+        User(email=f"u{i}@example.com", phone=f"+1{i:010d}", name=f"User {i}", password="pbkdf2_sha256$1$salt$" + "x" * 44)
+        for i in range(args.users)
+    ], batch_size=1000)
+    users = list(User.objects.all())
+    tenant = users[0].tenant
+    rng = random.Random(7)
+    pairs = [(make_uid(u), make_token(u), u) for u in rng.choices(users, k=args.iterations)]
+
+    def full(uid, token, user):
+        return token_generator.check_token(User.objects.get(pk=force_str(urlsafe_base64_decode(uid))), token)
+
+    def slim(uid, token, user):
+        return get_user_for_reset(uid, token, tenant) is not None
+
+    def bad_token(uid, token, user):
+        return get_user_for_reset(uid, token[:-1] + ("0" if token[-1] != "0" else "1"), tenant) is None
+
+    def hmac(uid, token, user):
+        return token_generator.check_token(user, token)
+
+    checks = {"full": full, "slim": slim, "bad token": bad_token, "hmac": hmac}
+    best = dict.fromkeys(checks, float("inf"))
+    for _ in range(args.rounds):
+        for name, check in checks.items():
+            t0 = time.perf_counter()
+            ok = sum(check(*pair) for pair in pairs)
+            best[name] = min(best[name], time.perf_counter() - t0)
+            assert ok == len(pairs), name
+    for name, elapsed in best.items():
+        print(f"{name:>9}: {elapsed / len(pairs) * 1e6:.0f}us per call")
+
+
+if __name__ == "__main__":
+    main()
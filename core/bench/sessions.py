@@ -0,0 +1,93 @@
+"""
+Revoke all other sessions of a user with thousands of refresh tokens.
+
+Creates one user with --tokens outstanding refresh tokens, each with its
+session, then times sessions.revoke_sessions(user, keep_sid=...), counts its
+queries and reports how much of the time went to marking the sids revoked in
+the cache. For comparison (--baseline) it blacklists the same tokens the way
+simplejwt's OutstandingToken scan does, one get_or_create per token:
+
+    python -m bench.sessions --tokens 5000
+    python -m bench.sessions --tokens 5000 --baseline
+"""
+import argparse
+import time
+import uuid
+from datetime import timedelta
+
+from . import setup
+
+CHUNK = 1000
+
+
+def generate(n):
+    from django.utils import timezone
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    from accounts.models import User, UserSession
+
+    now = timezone.now()
+    expires = now + timedelta(days=7)
+    user = User.objects.create_user(email="many@example.com", password="!")
+    jtis = [uuid.uuid4().hex for _ in range(n)]
+    OutstandingToken.objects.bulk_create(
+        [OutstandingToken(user=user, jti=jti, token="-", created_at=now, expires_at=expires) for jti in jtis],
+        batch_size=CHUNK,
+    )
+    UserSession.objects.bulk_create(
+        [UserSession(user=user, jti=jti, created_at=now, last_seen_at=now, expires_at=expires) for jti in jtis],
+        batch_size=CHUNK,
+    )
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--baseline", action="store_true", help="one get_or_create per outstanding token")
+    args = parser.parse_args()
+
+    setup("sessions")
+    from django.db import connection
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    from accounts import sessions
+    from accounts.models import UserSession
+
+    user = generate(args.tokens)
+    keep = UserSession.objects.filter(user=user).first()
+
+    mark_revoked, cache_time = sessions._mark_revoked, [0.0]
+
+    def timed_mark_revoked(sids):
+        t0 = time.perf_counter()
+        mark_revoked(sids)
+        cache_time[0] += time.perf_counter() - t0
+
+    sessions._mark_revoked = timed_mark_revoked
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        t0 = time.perf_counter()
+        if args.baseline:
+            for token in OutstandingToken.objects.filter(user=user).exclude(jti=keep.jti):
+                BlacklistedToken.objects.get_or_create(token=token)
+            revoked = args.tokens - 1
+        else:
+            revoked = sessions.revoke_sessions(user.pk, keep_sid=keep.pk)
+        elapsed = time.perf_counter() - t0
+
+    blacklisted = BlacklistedToken.objects.filter(token__user=user).count()
+    print(f"{'per-token loop' if args.baseline else 'revoke_sessions'}: {args.tokens} tokens, "
+          f"{revoked} sessions revoked, {blacklisted} blacklisted in {elapsed * 1000:.0f}ms "
+          f"({(elapsed - cache_time[0]) * 1000:.0f}ms database, {cache_time[0] * 1000:.0f}ms cache) "
+          f"with {queries[0]} queries")
+    assert blacklisted == args.tokens - 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Project settings on a scratch database and cache, for the scripts in bench/."""
+import os
+
+from core.settings import *  # noqa: F401,F403
+
+DEBUG = False  # no per-query bookkeeping while measuring
+ALLOWED_HOSTS = ["*"]
+
+DATABASES["default"]["NAME"] = os.environ["BENCH_DB"]
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ["BENCH_CACHE"],
+    }
+}
+
+EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+AUTH_EVENTS = {"ENABLED": False}
@@ -0,0 +1,108 @@
+"""
+Mixed read/write auth traffic on SQLite from several worker processes.
+
+Forks --procs processes with --threads threads each. Every request sends a
+verification code (a write plus an email) or checks a wrong one (a
+conditional UPDATE), through the Django test client so the full view stack
+runs. Reports successful requests per second, how many failed with
+"database is locked" and the latency spread. Compare the tuned backend with
+Django's stock one:
+
+    python -m bench.sqlite --profile tuned --procs 8 --threads 8
+    python -m bench.sqlite --profile default --procs 8 --threads 8
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import threading
+import time
+
+from . import setup
+
+USERS = 2000
+
+
+def worker(seconds, threads, results):
+    from django.db import OperationalError, connection
+    from django.test import Client
+
+    def run(out):
+        client = Client()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            identifier = f"u{random.randrange(USERS)}@example.com"
+            t0 = time.perf_counter()
+            try:
+                if random.random() < 0.5:
+                    body = {"identifier": identifier, "purpose": "verify"}
+                    response = client.post("/api/auth/send-token/", body, content_type="application/json")
+                else:
+                    body = {"identifier": identifier, "code": "000000", "purpose": "email"}
+                    response = client.post("/api/auth/verify-token/", body, content_type="application/json")
+                out["ok" if response.status_code < 500 else "error"] += 1
+            except OperationalError as e:
+                out["locked" if "locked" in str(e) else "error"] += 1
+            out["latency"].append(time.perf_counter() - t0)
+        connection.close()
+
+    outs = [{"ok": 0, "locked": 0, "error": 0, "latency": []} for _ in range(threads)]
+    pool = [threading.Thread(target=run, args=(out,)) for out in outs]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put({
+        "ok": sum(o["ok"] for o in outs),
+        "locked": sum(o["locked"] for o in outs),
+        "error": sum(o["error"] for o in outs),
+        "latency": [x for o in outs for x in o["latency"]],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=("tuned", "default"), default="tuned", help="SQLITE_PROFILE")
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    os.environ["SQLITE_PROFILE"] = args.profile
+    setup("sqlite")
+    from django.conf import settings
+    from django.db import connection
+
+    from accounts.models import User
+
+    # measure the database, not the gates or the event log
+    settings.ADMISSION_CONTROL = {"ENABLED": False}
+    User.objects.bulk_create([User(email=f"u{i}@example.com", password="!") for i in range(USERS)])
+    connection.close()
+
+    results = mp.Queue()
+    procs = [mp.Process(target=worker, args=(args.seconds, args.threads, results)) for _ in range(args.procs)]
+    for p in procs:
+        p.start()
+    totals = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    ok = sum(r["ok"] for r in totals)
+    locked = sum(r["locked"] for r in totals)
+    errors = sum(r["error"] for r in totals)
+    latency = sorted(x for r in totals for x in r["latency"])
+    n = max(len(latency), 1)
+
+    def ms(p):
+        return latency[min(int(n * p), n - 1)] * 1000 if latency else 0.0
+
+    print(
+        f"{args.profile}: {args.procs}x{args.threads} for {args.seconds:g}s: {ok / args.seconds:.0f} ok/s, "
+        f"locked {locked} ({locked / n:.2%}), other errors {errors}, "
+        f"p50 {ms(.5):.1f}ms p99 {ms(.99):.1f}ms max {ms(1):.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
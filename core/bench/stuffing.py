@@ -0,0 +1,91 @@
+"""
+Replay a synthetic login trace through the credential-stuffing detector.
+
+The trace mixes benign logins (20k users behind 8k addresses, 10% typos),
+an office NAT with 300 real users, a stuffing run from 40 addresses, a
+low-and-slow botnet spread over 3000 addresses and a spray of one-shot
+addresses that only exists to push the source tables to their bound.
+Reports how much of each group was blocked, the cost per event and the
+detector's memory, and exits non-zero when the sketches outgrow the bound
+the configuration promises (four windows: current and previous, local and
+merged from peers, each with MAX_TRACKED_SOURCES HyperLogLogs at most):
+
+    python -m bench.stuffing
+    python -m bench.stuffing --mem   # also trace the Python heap (slower)
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from . import setup
+
+T0 = 1_000_000.0
+
+
+def trace(rng, spray):
+    events = []
+    for _ in range(40000):
+        ip = f"10.{rng.randint(0, 31)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        events.append((T0 + rng.random() * 1800, ip, f"user{rng.randint(0, 20000)}@example.com", rng.random() > 0.1, "benign"))
+    for _ in range(1500):
+        events.append((T0 + rng.random() * 1800, "203.0.113.10", f"staff{rng.randint(0, 300)}@corp.example", rng.random() > 0.15, "benign"))
+    for a in range(40):
+        ip = f"198.51.{100 + a % 4}.{a + 1}"
+        for j in range(500):
+            events.append((T0 + 300 + rng.random() * 600, ip, f"leak{a}_{j}@mail.example", rng.random() < 0.005, "attack"))
+    for b in range(3000):
+        ip = f"192.0.{b % 12}.{b // 12 % 254 + 1}"
+        for j in range(4):
+            events.append((T0 + 600 + rng.random() * 900, ip, f"botnet{b}_{j}@mail.example", rng.random() < 0.005, "attack"))
+    for s in range(spray):
+        ip = f"100.{64 + s // 65536 % 64}.{s // 256 % 256}.{s % 256}"
+        events.append((T0 + rng.random() * 1800, ip, f"spray{s}@mail.example", rng.random() > 0.5, "spray"))
+    events.sort()
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--spray", type=int, default=50000, help="one-shot source addresses")
+    parser.add_argument("--mem", action="store_true", help="measure peak Python heap with tracemalloc")
+    args = parser.parse_args()
+
+    setup("stuffing", migrate=False)
+    from accounts import stuffing
+
+    events = trace(random.Random(args.seed), args.spray)
+    cfg = {**stuffing.get_config(), "MERGE_INTERVAL": 0}
+    detector = stuffing.Detector(cfg)
+    cms_bytes = 2 * cfg["CMS_WIDTH"] * cfg["CMS_DEPTH"] * detector.current.attempts.table.itemsize
+    bound = 4 * (cms_bytes + cfg["MAX_TRACKED_SOURCES"] * (1 << cfg["HLL_PRECISION"]))
+    if args.mem:
+        tracemalloc.start()
+
+    stats = {}
+    started = time.perf_counter()
+    for ts, ip, identifier, success, label in events:
+        seen = stats.setdefault(label, [0, 0])
+        seen[0] += 1
+        if detector.tripped(ip, now=ts) is not None:
+            seen[1] += 1
+            continue
+        detector.observe(ip, identifier, success, now=ts)
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(events)} events in {elapsed:.2f}s ({elapsed / len(events) * 1e6:.1f}us each)")
+    for label, (n, blocked) in stats.items():
+        print(f"  {label}: {n} attempts, {blocked} blocked ({blocked / n:.1%})")
+    tracked = max(len(detector.current.distinct), len(detector.previous.distinct))
+    print(f"sketches {detector.nbytes() / 1024:.0f} KiB of {bound / 1024:.0f} KiB bound, "
+          f"{tracked} sources tracked per window (max {cfg['MAX_TRACKED_SOURCES']})")
+    if args.mem:
+        print(f"python heap peak {tracemalloc.get_traced_memory()[1] / 2**20:.1f} MiB")
+    if detector.nbytes() > bound:
+        sys.exit("sketches exceed the configured bound")
+
+
+if __name__ == "__main__":
+    main()
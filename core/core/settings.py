@@ -38,6 +38,9 @@ if DEBUG:
 else:
     WEBSITE_URL = dotenv(WEBSITE_URL)
     FRONTEND_BASE = dotenv(WEBSITE_URL)
+
+# link sent by /api/auth/password-reset/; the frontend posts uid/token to /api/auth/reset-password/
+PASSWORD_RESET_URL = os.getenv("PASSWORD_RESET_URL", WEBSITE_URL + "/reset-password?uid={uid}&token={token}")
 # Application definition
 
 AUTHENTICATION_BACKENDS = [
@@ -77,8 +80,24 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
+    "accounts.tenancy.TenantMiddleware",
 ]
 
+# Multi-tenancy: every user belongs to one tenant; identifiers are unique per tenant.
+# Tenant is resolved from TENANT_HEADER, then TENANT_HOSTS, then <tenant>.TENANT_BASE_DOMAIN.
+# The header is only read from TRUSTED_PROXIES unless TENANT_HEADER_ENABLED lets any client set it.
+TENANT_DEFAULT = os.getenv("TENANT_DEFAULT", "default")
+TENANT_HEADER = "HTTP_X_TENANT"
+TENANT_HEADER_ENABLED = os.getenv("TENANT_HEADER_ENABLED", "") == "1"
+TENANT_HOSTS = {}
+TENANT_BASE_DOMAIN = os.getenv("TENANT_BASE_DOMAIN")
+TENANTS = []  # optional allow-list; empty accepts any valid tenant key
+
+# Client addresses (accounts.clientip): list the load balancers/reverse proxies in front of the app
+# (addresses or CIDR networks) so the client IP is read from CLIENT_IP_HEADER; otherwise REMOTE_ADDR is used
+TRUSTED_PROXIES = [p.strip() for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()]
+CLIENT_IP_HEADER = "HTTP_X_FORWARDED_FOR"
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -103,10 +122,16 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Single-node installs run on the tuned SQLite backend (core.sqlite: WAL, pragmas, one writer per
+# process); SQLITE_PROFILE=default switches back to Django's stock sqlite3 backend
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.sqlite' if SQLITE_PROFILE == "tuned" else 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # per-key overrides of core.sqlite.base.PRAGMAS, e.g. {"pragmas": {"mmap_size": 0}}
+        'OPTIONS': {},
     }
 }
 
@@ -121,6 +146,27 @@ DATABASES = {
 #         "PORT": os.getenv("POSTGRES_PORT", "5432"),
 #     }
 # }
+
+# Cache
+# Shared by all worker processes: session revocation, reset-link claims and credential-stuffing
+# detection depend on it (accounts.W001). REDIS_URL switches to Redis once there's more than one node.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv("CACHE_DIR", BASE_DIR / '.cache'),
+            # revoked sessions must not be culled before their access tokens expire
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -178,13 +224,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 AUTH_USER_MODEL = 'accounts.User'
+# USERNAME_FIELD (email) is unique per tenant, not globally; MultiFieldModelBackend handles lookups
+SILENCED_SYSTEM_CHECKS = ["auth.W004"]
 
 CORS_ORIGIN_ALLOW_ALL = True #THIS IS TO ALLOW ALL THE FRONTEND PORTS
 CORS_ALLOW_CREDENTIALS = True # THIS IS REALLY IMPORTANT BECAUSE WE LOGIN WITH COOKIES
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.backends.TenantJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -198,5 +246,26 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# The accounts modules below read their settings over their own DEFAULTS (accounts.events.DEFAULTS,
+# accounts.admission.DEFAULTS, ...): list only the keys that differ here.
+
+# Auth event log (accounts.events): buffered in-process and flushed in batches
+AUTH_EVENTS = {
+    "JSONL_PATH": os.getenv("AUTH_EVENTS_JSONL_PATH"),
+}
+
+# Admission control for accounts.urls (accounts.admission): ADMISSION_CONTROL, limits are per worker process
+# Device sessions (accounts.sessions): SESSIONS
+# Credential-stuffing detection for logins (accounts.stuffing): CREDENTIAL_STUFFING
+# Account deletion (accounts.deletion): ACCOUNT_DELETION; the purge_deleted_users command removes
+# or anonymizes soft-deleted users after the grace period
+
+# User change feed (accounts.changes) served at /api/auth/changes/; committed changes also go to SINKS
+CHANGE_FEED = {
+    "JSONL_PATH": os.getenv("CHANGE_FEED_JSONL_PATH"),
+}
+
+# VERIFICATION_MAX_ATTEMPTS (accounts.verification): wrong codes allowed before the pending code is invalidated
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@example.com'
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+SQLite backend for single-node installs.
+
+On top of Django's sqlite3 backend:
+- every new connection applies PRAGMAS (WAL, busy_timeout, synchronous=NORMAL,
+  mmap and page cache), overridable per key with OPTIONS["pragmas"]
+- transactions start with BEGIN IMMEDIATE (unless OPTIONS["transaction_mode"]
+  says otherwise), so a transaction that reads and then writes can't fail to
+  upgrade its lock with "database is locked"
+- writes from all threads of a process go through one writer lock: atomic
+  blocks hold it from BEGIN to COMMIT/ROLLBACK, autocommit writes for the
+  single statement. Waiting threads queue on the lock instead of polling in
+  SQLite's busy handler; other processes are still arbitrated by busy_timeout.
+
+Reads keep Django's one connection per thread and, with WAL, never wait for
+the writer.
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # durable across crashes of the app, may lose the last commits on power loss
+    "busy_timeout": 5000,  # ms
+    "cache_size": -65536,  # negative is KiB: 64 MiB per connection
+    "mmap_size": 268435456,  # 256 MiB
+    "temp_store": "MEMORY",
+}
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+_writer_locks = {}
+_writer_locks_guard = threading.Lock()
+
+
+def writer_lock(name):
+    """The process-wide writer lock of one database file."""
+    with _writer_locks_guard:
+        return _writer_locks.setdefault(str(name), threading.Lock())
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    def __init__(self, connection, writer):
+        super().__init__(connection)
+        self.writer = writer
+
+    def _is_autocommit_write(self, query):
+        return not self.connection.in_transaction and query.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+    def execute(self, query, params=None):
+        if self._is_autocommit_write(query):
+            with self.writer():
+                return super().execute(query, params)
+        return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        if self._is_autocommit_write(query):
+            with self.writer():
+                return super().executemany(query, param_list)
+        return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._holds_writer = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # looked up per connection: the test runner renames the database after the wrapper exists
+        self._writer = writer_lock(kwargs["database"])
+        self.pragmas = {**PRAGMAS, **kwargs.pop("pragmas", {})}
+        if self.transaction_mode is None:
+            self.transaction_mode = "IMMEDIATE"
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=partial(SQLiteCursorWrapper, writer=self.writer))
+
+    def _acquire_writer(self):
+        # after busy_timeout go ahead without the lock and let SQLite's own locking decide
+        timeout = self.pragmas.get("busy_timeout", 5000) / 1000
+        self._holds_writer = self._writer.acquire(timeout=timeout)
+
+    def _release_writer(self):
+        if self._holds_writer:
+            self._holds_writer = False
+            self._writer.release()
+
+    @contextmanager
+    def writer(self):
+        self._acquire_writer()
+        try:
+            yield
+        finally:
+            self._release_writer()
+
+    def _start_transaction_under_autocommit(self):
+        self._acquire_writer()
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._release_writer()
+            raise
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_writer()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_writer()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_writer()